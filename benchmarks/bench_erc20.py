@@ -0,0 +1,52 @@
+"""
+Seeding a token with many wallets, one mint at a time against `mint_many`.
+
+Checks that both ways end with the same balances, then prints the time it
+took to allocate the wallets and to seed them:
+
+    python benchmarks/bench_erc20.py --size 1000000
+"""
+from pymorpho.mocks.token import Token
+from pymorpho.utils.Mixer import World
+from argparse import ArgumentParser
+from time import perf_counter
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=100_000)
+    args = parser.parse_args()
+
+    world = World()
+    owner = world.new_address()
+
+    start = perf_counter()
+    wallets = world.new_addresses(args.size)
+    print(f"{'allocate wallets':<20} {perf_counter() - start:>8.2f} s")
+
+    amounts = [(i % 1000 + 1) * 10**18 for i in range(args.size)]
+    timings = {}
+    tokens = {}
+    for name in ("mint", "mint_many"):
+        token = world.contracts_and_eoas[
+            Token(name, name, 18, sender=owner, world=world).deploy()
+        ]
+        start = perf_counter()
+        if name == "mint":
+            for wallet, amount in zip(wallets, amounts):
+                token.mint(wallet, amount, owner)
+        else:
+            token.mint_many(wallets, amounts, owner)
+        timings[name] = perf_counter() - start
+        tokens[name] = token
+
+    assert tokens["mint"].balance_of_many(wallets) == amounts
+    assert tokens["mint_many"].balance_of_many(wallets) == amounts
+    assert tokens["mint"].total_supply() == tokens["mint_many"].total_supply()
+
+    for name, elapsed in timings.items():
+        print(f"{name:<20} {elapsed:>8.2f} s")
+
+
+if __name__ == "__main__":
+    main()
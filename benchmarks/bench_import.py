@@ -0,0 +1,66 @@
+"""
+Import time of pymorpho, in fresh interpreters.
+
+Times each import statement in `--repeat` new processes and prints the
+median, then exits with an error if importing the whole stack takes longer
+than `--budget` milliseconds, so that CI can hold the line:
+
+    python benchmarks/bench_import.py --budget 150
+"""
+from argparse import ArgumentParser
+from statistics import median
+import subprocess
+import sys
+
+
+STATEMENTS = {
+    "pymorpho": "import pymorpho",
+    "utils.Mixer": "import pymorpho.utils.Mixer",
+    "MorphoBlue": "from pymorpho import MorphoBlue",
+    "MetaMorpho": "from pymorpho import MetaMorpho",
+    # everything examples/deploying_morpho.py imports
+    "full stack": (
+        "from pymorpho import MorphoBlue, MetaMorpho, AdaptiveCurveIRM, "
+        "Token, MockOracle, MarketParams"
+    ),
+}
+
+# statement checked against the budget
+BUDGETED = "full stack"
+
+
+def import_time(statement: str) -> float:
+    """Time taken by `statement` in a new interpreter, in ms."""
+    code = (
+        "from time import perf_counter\n"
+        "start = perf_counter()\n"
+        f"{statement}\n"
+        "print((perf_counter() - start) * 1e3)\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return float(output.stdout)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=9)
+    parser.add_argument("--budget", type=float, default=None, help="in ms")
+    args = parser.parse_args()
+
+    times = {}
+    print(f"median of {args.repeat} interpreters")
+    for name, statement in STATEMENTS.items():
+        times[name] = median(import_time(statement) for _ in range(args.repeat))
+        print(f"{name:<14} {times[name]:>8.1f} ms")
+
+    if args.budget is not None and times[BUDGETED] > args.budget:
+        sys.exit(
+            f"importing the {BUDGETED} took {times[BUDGETED]:.1f} ms, "
+            f"over the budget of {args.budget:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
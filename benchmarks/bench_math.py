@@ -0,0 +1,72 @@
+"""
+Throughput of the interest math kernels, scalar against batch.
+
+Checks that the exact batch kernels match the scalar functions element by
+element, then prints the time per element of each variant:
+
+    python benchmarks/bench_math.py --size 100000
+"""
+from pymorpho.adaptivecurveirm.libraries.adaptivecurve.exp_lib import ExpLib
+from pymorpho.blue.libraries.math_lib import MathLib, WAD
+from argparse import ArgumentParser
+from timeit import Timer
+import numpy as np
+
+
+def per_element(function, size: int, repeat: int) -> float:
+    """Best time per element over `repeat` runs of `function`, in ns."""
+    timer = Timer(function)
+    return min(timer.repeat(repeat=repeat, number=1)) / size * 1e9
+
+
+def inputs(size: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    # linear adaptations of a few seconds to a few days of accrual
+    exps = [int(value) for value in rng.uniform(-3, 3, size) * WAD]
+    # borrow rates up to 1000% a year over up to a day
+    rates = [int(value) for value in rng.uniform(0, 10 * WAD / 31536000, size)]
+    elapsed = [int(value) for value in rng.integers(1, 86400, size)]
+    return exps, rates, elapsed
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    exps, rates, elapsed = inputs(args.size)
+    exps_array = np.array(exps, dtype=object)
+    rates_array = np.array(rates, dtype=object)
+    elapsed_array = np.array(elapsed, dtype=object)
+
+    assert list(ExpLib.w_exp_many(exps_array)) == [ExpLib.w_exp(x) for x in exps]
+    assert list(MathLib.w_taylor_compounded_many(rates_array, elapsed_array)) == [
+        MathLib.w_taylor_compounded(x, n) for x, n in zip(rates, elapsed)
+    ]
+
+    exps_float = np.array(exps, dtype=np.float64)
+    rates_float = np.array(rates, dtype=np.float64)
+    elapsed_float = np.array(elapsed, dtype=np.float64)
+    benchmarks = {
+        "w_exp scalar": lambda: [ExpLib.w_exp(x) for x in exps],
+        "w_exp_many exact": lambda: ExpLib.w_exp_many(exps_array),
+        "w_exp_many float64": lambda: ExpLib.w_exp_many(exps_float, exact=False),
+        "w_taylor_compounded scalar": lambda: [
+            MathLib.w_taylor_compounded(x, n) for x, n in zip(rates, elapsed)
+        ],
+        "w_taylor_compounded_many exact": lambda: MathLib.w_taylor_compounded_many(
+            rates_array, elapsed_array
+        ),
+        "w_taylor_compounded_many float64": lambda: MathLib.w_taylor_compounded_many(
+            rates_float, elapsed_float, exact=False
+        ),
+    }
+
+    print(f"{args.size} elements, best of {args.repeat}")
+    for name, function in benchmarks.items():
+        print(f"{name:<34} {per_element(function, args.size, args.repeat):>10.1f} ns/element")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Memory taken by the storage values of the contracts, slotted against __dict__.
+
+Builds `--size` instances of each storage type of MorphoBlue and MetaMorpho,
+and of a twin dataclass with the same fields and a per-instance __dict__
+(how they used to be declared), then prints the bytes allocated per
+instance. Positions and markets are also measured the way MorphoBlue stores
+them, keyed by market id and user in a storage:
+
+    python benchmarks/bench_memory.py --size 500000
+"""
+from pymorpho.blue.types import Market, Position
+from pymorpho.metamorpho.libraries.pending_lib import (
+    MarketConfig,
+    PendingAddress,
+    PendingUint192,
+)
+from pymorpho.utils.Mixer import World
+from pymorpho.utils.storage import Storage
+from argparse import ArgumentParser
+from dataclasses import fields, make_dataclass
+import gc
+import tracemalloc
+
+
+def unslotted(cls: type) -> type:
+    """A dataclass with the fields of `cls` and a __dict__ per instance."""
+    return make_dataclass(
+        cls.__name__, [(field.name, field.type, field.default) for field in fields(cls)]
+    )
+
+
+def allocated(build) -> int:
+    """Bytes still allocated once `build()` returned, while its result is alive."""
+    gc.collect()
+    tracemalloc.start()
+    value = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del value
+    return size
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=100_000)
+    args = parser.parse_args()
+    size = args.size
+
+    # large values, as in storage, so that they aren't small int singletons
+    values = [10**18 + i for i in range(size)]
+    users = World().new_addresses(size)
+    id = bytes(32)
+
+    # constructor arguments of each type from a value
+    arguments = {
+        Position: lambda value: (value, value, value),
+        Market: lambda value: (value, value, value, value, value, 0),
+        MarketConfig: lambda value: (value, True, 0),
+        PendingUint192: lambda value: (value, value),
+        PendingAddress: lambda value: (users[0], value),
+    }
+
+    print(f"{size} instances, bytes per instance")
+    print(f"{'':<16} {'__dict__':>10} {'slots':>10}")
+    for cls, build in arguments.items():
+        twin = unslotted(cls)
+        before = allocated(lambda: [twin(*build(value)) for value in values])
+        after = allocated(lambda: [cls(*build(value)) for value in values])
+        print(f"{cls.__name__:<16} {before / size:>10.1f} {after / size:>10.1f}")
+
+    def positions(cls):
+        storage = Storage(cls)
+        for user, value in zip(users, values):
+            storage[(id, user)] = cls(value, value, value)
+        return storage
+
+    before = allocated(lambda: positions(unslotted(Position)))
+    after = allocated(lambda: positions(Position))
+    print(f"{'stored Position':<16} {before / size:>10.1f} {after / size:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Morpho Blue, MetaMorpho and the AdaptiveCurve IRM in Python.
+
+The main classes are exposed here, and a class is only imported along with
+its dependencies the first time it is accessed:
+
+    import pymorpho
+
+    world = pymorpho.World()
+    morpho = pymorpho.MorphoBlue(owner, world=world)
+"""
+from importlib import import_module
+
+
+# public name -> module defining it
+_LAZY = {
+    "Address": "pymorpho.utils.Mixer",
+    "ChainID": "pymorpho.utils.Mixer",
+    "InstanceType": "pymorpho.utils.Mixer",
+    "Metadata": "pymorpho.utils.Mixer",
+    "Mixer": "pymorpho.utils.Mixer",
+    "World": "pymorpho.utils.Mixer",
+    "MorphoBlue": "pymorpho.blue.morpho_blue",
+    "Market": "pymorpho.blue.types",
+    "MarketParams": "pymorpho.blue.types",
+    "Position": "pymorpho.blue.types",
+    "MetaMorpho": "pymorpho.metamorpho.metamorpho",
+    "MarketAllocation": "pymorpho.metamorpho.types",
+    "AdaptiveCurveIRM": "pymorpho.adaptivecurveirm.adaptive_curve_irm",
+    "ERC20": "pymorpho.openzeppelin.erc20",
+    "ERC4626": "pymorpho.openzeppelin.erc4626",
+    "MockOracle": "pymorpho.mocks.mock_oracle",
+    "Token": "pymorpho.mocks.token",
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name: str):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module 'pymorpho' has no attribute '{name}'")
+    value = getattr(import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(_LAZY))
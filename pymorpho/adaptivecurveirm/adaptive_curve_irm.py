@@ -1,4 +1,5 @@
-from pymorpho.utils.Mixer import Mixer, Metadata, Address, ChainID, InstanceType
+from __future__ import annotations
+from pymorpho.utils.Mixer import Mixer, Metadata, Address, ChainID, InstanceType, World
 from pymorpho.adaptivecurveirm.libraries.adaptivecurve.exp_lib import ExpLib
 from pymorpho.adaptivecurveirm.libraries.math_lib import MathLib 
 from pymorpho.adaptivecurveirm.libraries.utils_lib import UtilsLib
@@ -6,14 +7,25 @@ from pymorpho.blue.libraries.math_lib import MathLib as MorphoMathLib, WAD
 from pymorpho.blue.types import MarketParams, Market
 from pymorpho.adaptivecurveirm.libraries.errors_lib import ErrorsLib
 from pymorpho.adaptivecurveirm.libraries.adaptivecurve.constants_lib import ConstantsLib
-from collections import defaultdict
-from typing import Tuple
+from pymorpho.utils.storage import Storage
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from math import log
+from typing import Optional, Tuple, Union
+from pymorpho.utils.lazy import lazy_import
+import warnings
+
+np = lazy_import("numpy")
 
 
 class AdaptiveCurveIRM:
     def __init__(
         self,
         morpho: Address,
+        curve_steepness: int = ConstantsLib.CURVE_STEEPNESS,
+        adjustment_speed: int = ConstantsLib.ADJUSTMENT_SPEED,
+        target_utilization: int = ConstantsLib.TARGET_UTILIZATION,
+        initial_rate_at_target: int = ConstantsLib.INITIAL_RATE_AT_TARGET,
         metadata: Metadata = Metadata(
             ChainID.ETH_MAINNET,
             Address.ZERO_ADDRESS,
@@ -21,19 +33,34 @@ class AdaptiveCurveIRM:
             InstanceType.CONTRACT,
         ),
         sender=Mixer.ZERO_ADDRESS,
+        world: World = Mixer.world,
     ):
         self.MORPHO: Address = Mixer.ZERO_ADDRESS
-        self.rate_at_target: defaultdict[bytes, int] = defaultdict(int)
+        self.rate_at_target: Storage[bytes, int] = Storage(int)
 
         assert morpho != Mixer.ZERO_ADDRESS, ErrorsLib.ZERO_ADDRESS
+        assert curve_steepness >= WAD, ErrorsLib.INVALID_CURVE_STEEPNESS
+        assert 0 < target_utilization < WAD, ErrorsLib.INVALID_TARGET_UTILIZATION
 
         self.MORPHO = morpho
 
+        # parameters of the curve
+        self.CURVE_STEEPNESS: int = curve_steepness
+        self.ADJUSTMENT_SPEED: int = adjustment_speed
+        self.TARGET_UTILIZATION: int = target_utilization
+        self.INITIAL_RATE_AT_TARGET: int = initial_rate_at_target
+
+        # coefficients derived from the parameters, used on every rate
+        self._err_norm_factor_above: int = WAD - target_utilization
+        self._coeff_below: int = WAD - MathLib.w_div_to_zero(WAD, curve_steepness)
+        self._coeff_above: int = curve_steepness - WAD
+
         # utility stuff for simualtion
-        self.metadata = metadata
+        self.metadata = replace(metadata)
+        self.world = world
     
     def deploy(self) -> Address:
-        self.metadata.address = Mixer.register(self)
+        self.metadata.address = self.world.register(self)
         return self.metadata.address
 
     def borrow_rate_view(
@@ -42,6 +69,17 @@ class AdaptiveCurveIRM:
         avg_rate, _ = self._borrow_rate(market_params.id(), market)
         return avg_rate
 
+    def rate_curve_view(
+        self, market_params: MarketParams, market: Market, sender=Mixer.ZERO_ADDRESS
+    ) -> Tuple[int, int, int]:
+        """
+        Shape of the borrow rate curve of the market as of now: its rate at
+        target once accrued to the current block, as `borrow_rate_view` would
+        leave it, along with the curve steepness and the target utilization.
+        """
+        _, rate_at_target = self._borrow_rate(market_params.id(), market)
+        return rate_at_target, self.CURVE_STEEPNESS, self.TARGET_UTILIZATION
+
     def borrow_rate(
         self, market_params: MarketParams, market: Market, sender=Mixer.ZERO_ADDRESS
     ) -> int:
@@ -55,29 +93,111 @@ class AdaptiveCurveIRM:
 
         return avg_rate
 
-    def _borrow_rate(self, id: bytes, market: Market) -> Tuple[int, int]:
-        utilization = (
+    def project(
+        self,
+        markets_params: list[MarketParams],
+        timestamps: np.ndarray,
+        sender=Mixer.ZERO_ADDRESS,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Projects each market to the matching timestamp assuming its
+        utilization stays what it is now, with `StaticAdaptiveCurveIRM.project`
+        and the parameters of this IRM.
+        """
+        morpho = self.world.contracts_and_eoas[self.MORPHO]
+        markets = [morpho.market(market_params.id()) for market_params in markets_params]
+        utilization = [
             MorphoMathLib.w_div_down(market.total_borrow_assets, market.total_supply_assets)
             if market.total_supply_assets > 0
             else 0
+            for market in markets
+        ]
+        return StaticAdaptiveCurveIRM.project(
+            utilization,
+            [self.rate_at_target.read(market_params.id()) for market_params in markets_params],
+            np.asarray(timestamps, dtype=np.float64)
+            - np.array([market.last_update for market in markets], dtype=np.float64),
+            self.CURVE_STEEPNESS,
+            self.ADJUSTMENT_SPEED,
+            self.TARGET_UTILIZATION,
+            self.INITIAL_RATE_AT_TARGET,
+        )
+
+    def rate_table(self, config: "RateTableConfig", elapsed: int = None) -> "RateTable":
+        """
+        The rate table of this IRM's parameters for `config` and steps of
+        `elapsed` seconds (the first step length of `config` by default),
+        built once.
+        """
+        return RateTable.build(
+            self.CURVE_STEEPNESS,
+            self.ADJUSTMENT_SPEED,
+            self.TARGET_UTILIZATION,
+            self.INITIAL_RATE_AT_TARGET,
+            config,
+            elapsed,
+        )
+
+    def _borrow_rate(self, id: bytes, market: Market) -> Tuple[int, int]:
+        return self._borrow_rate_at(
+            self.rate_at_target.read(id),
+            market.total_borrow_assets,
+            market.total_supply_assets,
+            self.world.block_timestamp(self.metadata.chain) - market.last_update,
+        )
+
+    def _borrow_rate_at(
+        self,
+        start_rate_at_target: int,
+        total_borrow_assets: int,
+        total_supply_assets: int,
+        elapsed: int,
+    ) -> Tuple[int, int]:
+        """
+        Average borrow rate and end rate at target of a market with the given
+        totals over `elapsed` seconds, starting from `start_rate_at_target`.
+        Doesn't read nor write any storage.
+
+        If the world has `approximate_rates` set, steps of one of the
+        configured lengths are looked up in a `RateTable` instead, and steps
+        of any other length warn that they are computed exactly.
+        """
+        utilization = (
+            MorphoMathLib.w_div_down(total_borrow_assets, total_supply_assets)
+            if total_supply_assets > 0
+            else 0
         )
+        config = self.world.approximate_rates
+        if config is not None and elapsed > 0 and start_rate_at_target != 0:
+            if config.covers(elapsed):
+                rates = self.rate_table(config, elapsed).lookup(
+                    utilization, start_rate_at_target
+                )
+                if rates is not None:
+                    return rates
+            else:
+                # worded after the config only, so that it's shown once per config
+                warnings.warn(
+                    f"approximate_rates only has rate tables for steps of "
+                    f"{config.steps()} seconds, steps of other lengths are "
+                    "computed exactly"
+                )
+
         err_norm_factor = (
-            WAD - ConstantsLib.TARGET_UTILIZATION
-            if utilization > ConstantsLib.TARGET_UTILIZATION
-            else ConstantsLib.TARGET_UTILIZATION
+            self._err_norm_factor_above
+            if utilization > self.TARGET_UTILIZATION
+            else self.TARGET_UTILIZATION
         )
-        err = MathLib.w_div_to_zero(utilization - ConstantsLib.TARGET_UTILIZATION, err_norm_factor)
-        start_rate_at_target = self.rate_at_target[id]
+        err = MathLib.w_div_to_zero(utilization - self.TARGET_UTILIZATION, err_norm_factor)
 
         avg_rate_at_target = 0
         end_rate_at_target = 0
 
         if start_rate_at_target == 0:
-            avg_rate_at_target = ConstantsLib.INITIAL_RATE_AT_TARGET
-            end_rate_at_target = ConstantsLib.INITIAL_RATE_AT_TARGET
+            avg_rate_at_target = self.INITIAL_RATE_AT_TARGET
+            end_rate_at_target = self.INITIAL_RATE_AT_TARGET
         else:
-            speed = MathLib.w_mul_to_zero(ConstantsLib.ADJUSTMENT_SPEED, err)
-            elapsed = Mixer.block_timestamp(self.metadata.chain) - market.last_update
+            speed = MathLib.w_mul_to_zero(self.ADJUSTMENT_SPEED, err)
             linear_adaptation = speed * elapsed
 
             if linear_adaptation == 0:
@@ -88,7 +208,7 @@ class AdaptiveCurveIRM:
                     start_rate_at_target, linear_adaptation
                 )
                 mid_rate_at_target = self._new_rate_at_target(
-                    start_rate_at_target, linear_adaptation // 2
+                    start_rate_at_target, MathLib.div_to_zero(linear_adaptation, 2)
                 )
                 avg_rate_at_target = (
                     start_rate_at_target + end_rate_at_target + 2 * mid_rate_at_target
@@ -97,17 +217,19 @@ class AdaptiveCurveIRM:
         return self._curve(avg_rate_at_target, err), end_rate_at_target
 
     def _curve(self, _rate_at_target, err) -> int:
-        coeff = (
-            WAD - MathLib.w_div_to_zero(WAD, ConstantsLib.CURVE_STEEPNESS)
-            if err < 0
-            else ConstantsLib.CURVE_STEEPNESS - WAD
-        )
+        coeff = self._coeff_below if err < 0 else self._coeff_above
         return MathLib.w_mul_to_zero(
             MathLib.w_mul_to_zero(coeff, err) + WAD, 
             _rate_at_target
         )
 
     def _new_rate_at_target(self, start_rate_at_target, linear_adaptation) -> int:
+        # w_exp is at most WAD for a non positive input and at least WAD
+        # otherwise, so a rate at a bound pushed further out stays there
+        if linear_adaptation <= 0 and start_rate_at_target == ConstantsLib.MIN_RATE_AT_TARGET:
+            return ConstantsLib.MIN_RATE_AT_TARGET
+        if linear_adaptation >= 0 and start_rate_at_target == ConstantsLib.MAX_RATE_AT_TARGET:
+            return ConstantsLib.MAX_RATE_AT_TARGET
         return UtilsLib.bound(
             MathLib.w_mul_to_zero(start_rate_at_target, ExpLib.w_exp(linear_adaptation)),
             ConstantsLib.MIN_RATE_AT_TARGET,
@@ -140,9 +262,7 @@ class StaticAdaptiveCurveIRM:
         current_timestamp: int
     ) -> int:
 
-        id = market_params.id()
         avg_rate, end_rate_at_target = StaticAdaptiveCurveIRM._borrow_rate(
-            id, 
             market,
             rate_at_target,
             current_timestamp
@@ -190,7 +310,7 @@ class StaticAdaptiveCurveIRM:
                     start_rate_at_target, linear_adaptation
                 )
                 mid_rate_at_target = StaticAdaptiveCurveIRM._new_rate_at_target(
-                    start_rate_at_target, linear_adaptation // 2
+                    start_rate_at_target, MathLib.div_to_zero(linear_adaptation, 2)
                 )
                 avg_rate_at_target = (
                     start_rate_at_target + end_rate_at_target + 2 * mid_rate_at_target
@@ -219,3 +339,459 @@ class StaticAdaptiveCurveIRM:
             ConstantsLib.MIN_RATE_AT_TARGET,
             ConstantsLib.MAX_RATE_AT_TARGET,
         )
+
+    @staticmethod
+    def borrow_rates(
+        total_supply_assets: np.ndarray,
+        total_borrow_assets: np.ndarray,
+        last_update: np.ndarray,
+        rate_at_target: np.ndarray,
+        current_timestamp: int,
+        exact: bool = True,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Batch version of `_borrow_rate` over markets given as arrays of their
+        fields, returning the arrays of their average borrow rates and end
+        rates at target.
+
+        With `exact`, the computation runs on object arrays of ints with the
+        rounding of the scalar version, so each element is bit-exact with it.
+        Otherwise it runs in float64, which is much faster but approximate:
+        the results are in the same units as the exact ones.
+        """
+        dtype = object if exact else np.float64
+        total_supply_assets = np.asarray(total_supply_assets, dtype=dtype)
+        total_borrow_assets = np.asarray(total_borrow_assets, dtype=dtype)
+        has_supply = total_supply_assets > 0
+        utilization = StaticAdaptiveCurveIRM._select(
+            has_supply,
+            StaticAdaptiveCurveIRM._div(
+                total_borrow_assets * WAD,
+                np.where(has_supply, total_supply_assets, 1),
+                exact,
+            ),
+            0,
+            exact,
+        )
+        return StaticAdaptiveCurveIRM._borrow_rates_at(
+            np.asarray(rate_at_target, dtype=dtype),
+            utilization,
+            current_timestamp - np.asarray(last_update, dtype=dtype),
+            ConstantsLib.CURVE_STEEPNESS,
+            ConstantsLib.ADJUSTMENT_SPEED,
+            ConstantsLib.TARGET_UTILIZATION,
+            ConstantsLib.INITIAL_RATE_AT_TARGET,
+            exact,
+        )
+
+    @staticmethod
+    def project(
+        utilization: np.ndarray,
+        rate_at_target: np.ndarray,
+        elapsed: np.ndarray,
+        curve_steepness: int = ConstantsLib.CURVE_STEEPNESS,
+        adjustment_speed: int = ConstantsLib.ADJUSTMENT_SPEED,
+        target_utilization: int = ConstantsLib.TARGET_UTILIZATION,
+        initial_rate_at_target: int = ConstantsLib.INITIAL_RATE_AT_TARGET,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Closed-form projection of markets whose utilization stays constant,
+        `elapsed` seconds after their rate at target was `rate_at_target`.
+
+        At constant utilization the rate at target grows exponentially at a
+        constant speed until it reaches a bound and stays there, so its path,
+        its integral and the time it hits the bound are all known in closed
+        form: each projection costs O(1) whatever the horizon. The model is
+        the limit of accruing continuously, which repeated accruals approach
+        as their interval shrinks.
+
+        All arguments broadcast against each other. Returns float64 arrays, in
+        the units of the contract, of the rate at target at the end of the
+        horizon, the average borrow rate over it and the borrow index it
+        compounds to, scaled by WAD.
+        """
+        utilization = np.asarray(utilization, dtype=np.float64)
+        rate_at_target = np.asarray(rate_at_target, dtype=np.float64)
+        elapsed = np.asarray(elapsed, dtype=np.float64)
+        target_utilization = np.asarray(target_utilization, dtype=np.float64)
+        curve_steepness = np.asarray(curve_steepness, dtype=np.float64) / WAD
+
+        err = (utilization - target_utilization) / np.where(
+            utilization > target_utilization,
+            WAD - target_utilization,
+            target_utilization,
+        )
+        speed = np.asarray(adjustment_speed, dtype=np.float64) / WAD * err
+        start = np.where(rate_at_target == 0, initial_rate_at_target, rate_at_target)
+
+        # time at which the rate at target reaches the bound it moves towards
+        bound = np.where(
+            speed > 0, ConstantsLib.MAX_RATE_AT_TARGET, ConstantsLib.MIN_RATE_AT_TARGET
+        )
+        moving = speed != 0
+        safe_speed = np.where(moving, speed, 1.0)
+        with np.errstate(divide="ignore"):
+            hit = np.where(
+                moving, np.maximum(np.log(bound / start) / safe_speed, 0.0), np.inf
+            )
+        before_hit = np.minimum(elapsed, hit)
+        end_rate_at_target = np.where(
+            elapsed >= hit, bound, start * np.exp(speed * before_hit)
+        )
+        integral = np.where(
+            moving, start * np.expm1(speed * before_hit) / safe_speed, start * before_hit
+        ) + np.where(elapsed > hit, bound * (elapsed - before_hit), 0.0)
+
+        curve = 1.0 + err * np.where(
+            err < 0, 1.0 - 1.0 / curve_steepness, curve_steepness - 1.0
+        )
+        avg_rate = curve * np.where(
+            elapsed > 0, integral / np.where(elapsed > 0, elapsed, 1.0), start
+        )
+        borrow_index = WAD * np.exp(curve * integral / WAD)
+        return end_rate_at_target, avg_rate, borrow_index
+
+    @staticmethod
+    def sweep(
+        utilizations: np.ndarray,
+        elapsed: np.ndarray,
+        curve_steepness: np.ndarray,
+        adjustment_speed: np.ndarray,
+        target_utilization: np.ndarray,
+        initial_rate_at_target: np.ndarray,
+        exact: bool = True,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rate path of one market under many parameter sets at once.
+
+        The market is accrued `len(utilizations)` times, the i-th time
+        `elapsed[i]` seconds after the previous one at a utilization of
+        `utilizations[i]`, starting from an uninitialized rate at target like
+        a newly created market. The parameters are arrays with one element per
+        parameter set, or scalars shared by all of them.
+
+        Returns the average borrow rates and end rates at target of every
+        accrual, as arrays of shape (parameter sets, accruals), or of shape
+        (accruals,) when every parameter is a scalar.
+        """
+        dtype = object if exact else np.float64
+        curve_steepness, adjustment_speed, target_utilization, initial_rate_at_target = (
+            np.asarray(parameter, dtype=dtype)
+            for parameter in np.broadcast_arrays(
+                curve_steepness,
+                adjustment_speed,
+                target_utilization,
+                initial_rate_at_target,
+            )
+        )
+        shape = curve_steepness.shape
+        rate_at_target = np.zeros(shape, dtype=dtype)
+        avg_rates, rates_at_target = [], []
+        for utilization, step in zip(utilizations, elapsed):
+            avg_rate, rate_at_target = StaticAdaptiveCurveIRM._borrow_rates_at(
+                rate_at_target,
+                np.full(shape, utilization, dtype=dtype),
+                np.full(shape, step, dtype=dtype),
+                curve_steepness,
+                adjustment_speed,
+                target_utilization,
+                initial_rate_at_target,
+                exact,
+            )
+            avg_rates.append(avg_rate)
+            rates_at_target.append(rate_at_target)
+        if not avg_rates:
+            empty = np.zeros(shape + (0,), dtype=dtype)
+            return empty, empty.copy()
+        return np.stack(avg_rates, axis=-1), np.stack(rates_at_target, axis=-1)
+
+    @staticmethod
+    def _borrow_rates_at(
+        start_rate_at_target: np.ndarray,
+        utilization: np.ndarray,
+        elapsed: np.ndarray,
+        curve_steepness,
+        adjustment_speed,
+        target_utilization,
+        initial_rate_at_target,
+        exact: bool,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        div, select = StaticAdaptiveCurveIRM._div, StaticAdaptiveCurveIRM._select
+
+        err_norm_factor = select(
+            utilization > target_utilization,
+            WAD - target_utilization,
+            target_utilization,
+            exact,
+        )
+        err = div((utilization - target_utilization) * WAD, err_norm_factor, exact)
+
+        speed = div(adjustment_speed * err, WAD, exact)
+        linear_adaptation = speed * elapsed
+        end_rate_at_target = StaticAdaptiveCurveIRM._new_rates_at_target(
+            start_rate_at_target, linear_adaptation, exact
+        )
+        mid_rate_at_target = StaticAdaptiveCurveIRM._new_rates_at_target(
+            start_rate_at_target, div(linear_adaptation, 2, exact), exact
+        )
+        avg_rate_at_target = div(
+            start_rate_at_target + end_rate_at_target + 2 * mid_rate_at_target, 4, exact
+        )
+
+        unchanged = linear_adaptation == 0
+        avg_rate_at_target = select(unchanged, start_rate_at_target, avg_rate_at_target, exact)
+        end_rate_at_target = select(unchanged, start_rate_at_target, end_rate_at_target, exact)
+        uninitialized = start_rate_at_target == 0
+        avg_rate_at_target = select(
+            uninitialized, initial_rate_at_target, avg_rate_at_target, exact
+        )
+        end_rate_at_target = select(
+            uninitialized, initial_rate_at_target, end_rate_at_target, exact
+        )
+
+        coeff = select(
+            err < 0,
+            WAD - div(WAD * WAD, curve_steepness, exact),
+            curve_steepness - WAD,
+            exact,
+        )
+        avg_rate = div((div(coeff * err, WAD, exact) + WAD) * avg_rate_at_target, WAD, exact)
+        return avg_rate, end_rate_at_target
+
+    @staticmethod
+    def _new_rates_at_target(
+        start_rate_at_target: np.ndarray, linear_adaptation: np.ndarray, exact: bool
+    ) -> np.ndarray:
+        return np.minimum(
+            np.maximum(
+                StaticAdaptiveCurveIRM._div(
+                    start_rate_at_target * ExpLib.w_exp_many(linear_adaptation, exact),
+                    WAD,
+                    exact,
+                ),
+                ConstantsLib.MIN_RATE_AT_TARGET,
+            ),
+            ConstantsLib.MAX_RATE_AT_TARGET,
+        )
+
+    @staticmethod
+    def _div(a, b, exact: bool):
+        if not exact:
+            return np.true_divide(a, b)
+        # signed division of solidity, which rounds towards zero where // floors
+        a, b = np.asarray(a, dtype=object), np.asarray(b, dtype=object)
+        quotient = np.abs(a) // np.abs(b)
+        return StaticAdaptiveCurveIRM._select((a < 0) != (b < 0), -quotient, quotient, exact)
+
+    @staticmethod
+    def _select(condition, a, b, exact: bool) -> np.ndarray:
+        # keeps exact results as python ints, np.where picks int64 for scalars
+        selected = np.where(condition, a, b)
+        return selected.astype(object) if exact else selected
+
+
+@dataclass(frozen=True)
+class RateTableConfig:
+    """
+    Settings of the approximate rates of a world: the step lengths tables
+    are built for, and their resolution, which trades memory for accuracy.
+    """
+
+    # length of the accrual steps looked up, or a tuple of lengths with one
+    # table each; steps of any other length are computed exactly
+    elapsed: Union[int, Tuple[int, ...]] = 12
+    utilization_points: int = 1025
+    # number of points checked against the exact rates to measure the error
+    error_samples: int = 4096
+
+    def steps(self) -> Tuple[int, ...]:
+        """The step lengths looked up in tables."""
+        return self.elapsed if isinstance(self.elapsed, tuple) else (self.elapsed,)
+
+    def covers(self, elapsed: int) -> bool:
+        """Whether steps of `elapsed` seconds are looked up in a table."""
+        if isinstance(self.elapsed, tuple):
+            return elapsed in self.elapsed
+        return elapsed == self.elapsed
+
+
+class RateTable:
+    """
+    Average borrow rates and end rates at target of an `AdaptiveCurveIRM`
+    over one step of `elapsed` seconds, precomputed over a grid of
+    utilizations.
+
+    Over a fixed step, the rates only depend on the rate at target through
+    products and bounds: the end and mid rates at target are the start one
+    times a growth factor of the utilization, bounded, and the average rate
+    is the curve factor of the utilization times their mean. The table thus
+    holds those three factors at each utilization, computed exactly and
+    interpolated linearly, and applies them to the rate at target directly,
+    which keeps the lookup exact along that axis, bounds included. The grid
+    has a node at the target utilization, where the factors have a kink.
+
+    `max_error` is the largest relative error against the exact rates over
+    a sample of points at the middle of the grid cells, where the
+    interpolation error peaks.
+    """
+
+    __slots__ = (
+        "config",
+        "elapsed",
+        "target_utilization",
+        "utilizations",
+        "end_factors",
+        "mid_factors",
+        "curve_factors",
+        "max_error",
+        "_below_scale",
+        "_above_scale",
+        "_target_position",
+    )
+
+    def __init__(
+        self,
+        curve_steepness: int,
+        adjustment_speed: int,
+        target_utilization: int,
+        initial_rate_at_target: int,
+        config: RateTableConfig,
+        elapsed: int = None,
+    ):
+        self.config = config
+        # the first step length of the config by default
+        self.elapsed = config.steps()[0] if elapsed is None else elapsed
+        self.target_utilization = target_utilization
+
+        below = max(2, round(config.utilization_points * target_utilization / WAD))
+        above = max(2, config.utilization_points - below + 1)
+        utilizations = np.concatenate(
+            (
+                np.linspace(0, target_utilization, below),
+                np.linspace(target_utilization, WAD, above)[1:],
+            )
+        ).round()
+
+        # factors at the nodes, with the rounding of the contract
+        div = StaticAdaptiveCurveIRM._div
+        nodes = np.array([int(utilization) for utilization in utilizations], dtype=object)
+        err = div(
+            (nodes - target_utilization) * WAD,
+            np.where(nodes > target_utilization, WAD - target_utilization, target_utilization),
+            True,
+        )
+        linear_adaptation = div(adjustment_speed * err, WAD, True) * self.elapsed
+        coeff = StaticAdaptiveCurveIRM._select(
+            err < 0,
+            WAD - div(WAD * WAD, curve_steepness, True),
+            curve_steepness - WAD,
+            True,
+        )
+
+        # plain lists, much faster than numpy to index one element at a time
+        self.utilizations: list[float] = utilizations.tolist()
+        self.end_factors: list[float] = [
+            value / WAD for value in ExpLib.w_exp_many(linear_adaptation)
+        ]
+        self.mid_factors: list[float] = [
+            value / WAD for value in ExpLib.w_exp_many(div(linear_adaptation, 2, True))
+        ]
+        self.curve_factors: list[float] = [
+            value / WAD for value in div(coeff * err, WAD, True) + WAD
+        ]
+        self._below_scale = (below - 1) / target_utilization
+        self._above_scale = (above - 1) / (WAD - target_utilization)
+        self._target_position = below - 1
+        self.max_error: float = self._measure_error(
+            curve_steepness, adjustment_speed, target_utilization, initial_rate_at_target
+        )
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def build(
+        curve_steepness: int,
+        adjustment_speed: int,
+        target_utilization: int,
+        initial_rate_at_target: int,
+        config: RateTableConfig,
+        elapsed: int = None,
+    ) -> "RateTable":
+        """Tables only depend on their arguments, so they're shared by every IRM."""
+        return RateTable(
+            curve_steepness,
+            adjustment_speed,
+            target_utilization,
+            initial_rate_at_target,
+            config,
+            elapsed,
+        )
+
+    def lookup(self, utilization: int, rate_at_target: int) -> Optional[Tuple[int, int]]:
+        """
+        Approximate average borrow rate and end rate at target over one step
+        starting at a non zero `rate_at_target`, or None if the utilization is
+        outside of the grid.
+        """
+        if not 0 <= utilization <= WAD:
+            return None
+        if utilization <= self.target_utilization:
+            position = utilization * self._below_scale
+        else:
+            position = (
+                self._target_position
+                + (utilization - self.target_utilization) * self._above_scale
+            )
+        i = min(int(position), len(self.utilizations) - 2)
+        weight = (utilization - self.utilizations[i]) / (
+            self.utilizations[i + 1] - self.utilizations[i]
+        )
+
+        end_factor = self.end_factors[i] + weight * (self.end_factors[i + 1] - self.end_factors[i])
+        mid_factor = self.mid_factors[i] + weight * (self.mid_factors[i + 1] - self.mid_factors[i])
+        curve_factor = self.curve_factors[i] + weight * (
+            self.curve_factors[i + 1] - self.curve_factors[i]
+        )
+        end_rate_at_target = min(
+            max(rate_at_target * end_factor, ConstantsLib.MIN_RATE_AT_TARGET),
+            ConstantsLib.MAX_RATE_AT_TARGET,
+        )
+        mid_rate_at_target = min(
+            max(rate_at_target * mid_factor, ConstantsLib.MIN_RATE_AT_TARGET),
+            ConstantsLib.MAX_RATE_AT_TARGET,
+        )
+        avg_rate_at_target = (rate_at_target + end_rate_at_target + 2 * mid_rate_at_target) / 4
+        return int(curve_factor * avg_rate_at_target), int(end_rate_at_target)
+
+    def _measure_error(self, *parameters: int) -> float:
+        rng = np.random.default_rng(0)
+        cells = rng.integers(0, len(self.utilizations) - 1, self.config.error_samples)
+        utilizations = [
+            int((self.utilizations[i] + self.utilizations[i + 1]) / 2) for i in cells
+        ]
+        rates = [
+            int(rate)
+            for rate in np.geomspace(
+                ConstantsLib.MIN_RATE_AT_TARGET,
+                ConstantsLib.MAX_RATE_AT_TARGET,
+                self.config.error_samples,
+            )[rng.permutation(self.config.error_samples)]
+        ]
+        avg_rates, end_rates = StaticAdaptiveCurveIRM._borrow_rates_at(
+            np.array(rates, dtype=object),
+            np.array(utilizations, dtype=object),
+            self.elapsed,
+            *parameters,
+            exact=True,
+        )
+
+        max_error = 0.0
+        for utilization, rate, avg_rate, end_rate in zip(
+            utilizations, rates, avg_rates, end_rates
+        ):
+            approx_avg_rate, approx_end_rate = self.lookup(utilization, rate)
+            max_error = max(
+                max_error,
+                abs(approx_avg_rate - avg_rate) / max(avg_rate, 1),
+                abs(approx_end_rate - end_rate) / max(end_rate, 1),
+            )
+        return max_error
@@ -1,4 +1,13 @@
+from __future__ import annotations
 from pymorpho.blue.libraries.math_lib import WAD
+from pymorpho.utils.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+# module level copies of the constants used by w_exp, cheaper to look up
+_LN_2_INT = 693147180559945309
+_HALF_LN_2_INT = _LN_2_INT // 2
+_TWO_WAD = 2 * WAD
 
 
 class ExpLib:
@@ -13,12 +22,56 @@ class ExpLib:
         if x >= ExpLib.WEXP_UPPER_BOUND:
             return ExpLib.WEXP_UPPER_VALUE
 
-        rounding_adjustment = -(ExpLib.LN_2_INT // 2) if x < 0 else ExpLib.LN_2_INT // 2
-        q = (x + rounding_adjustment) // ExpLib.LN_2_INT
-        r = x - q * ExpLib.LN_2_INT
-        exp_r = WAD + r + (r * r) // WAD // 2
+        # q = (x + rounding_adjustment) / LN_2_INT, rounded towards zero like
+        # the signed division of solidity
+        if x < 0:
+            q = -((_HALF_LN_2_INT - x) // _LN_2_INT)
+        else:
+            q = (x + _HALF_LN_2_INT) // _LN_2_INT
+        r = x - q * _LN_2_INT
+        # floor(floor(r * r / WAD) / 2) == floor(r * r / (2 * WAD))
+        exp_r = WAD + r + r * r // _TWO_WAD
 
+        # exp_r is positive, so the powers of two are exact shifts
         if q >= 0:
-            return (2**q) * exp_r
+            return exp_r << q
         else:
-            return exp_r // (2**int(abs(q)))
+            return exp_r >> -q
+
+    def w_exp_many(x: np.ndarray, exact: bool = True) -> np.ndarray:
+        """
+        `w_exp` of each element of `x`. With `exact`, returns an object array
+        of exact ints. Otherwise runs the same approximation in float64, in
+        the same WAD units.
+        """
+        if not exact:
+            x = np.asarray(x, dtype=np.float64)
+            clamped = np.clip(x, ExpLib.LN_WEI_INT, ExpLib.WEXP_UPPER_BOUND)
+            q = np.trunc(
+                (clamped + np.where(clamped < 0, -0.5, 0.5) * ExpLib.LN_2_INT)
+                / ExpLib.LN_2_INT
+            )
+            r = clamped - q * ExpLib.LN_2_INT
+            exp_r = WAD + r + r * r / WAD / 2
+            result = np.ldexp(exp_r, q.astype(np.int64))
+            # selected rather than assigned, so that 0-d inputs work too
+            return np.where(
+                x < ExpLib.LN_WEI_INT,
+                0.0,
+                np.where(
+                    x >= ExpLib.WEXP_UPPER_BOUND,
+                    float(ExpLib.WEXP_UPPER_VALUE),
+                    result,
+                ),
+            )
+
+        # applying the scalar version elementwise beats a pipeline of object
+        # array operations, which each pay the per element dispatch again
+        global _w_exp
+        if _w_exp is None:
+            _w_exp = np.frompyfunc(ExpLib.w_exp, 1, 1)
+        return np.asarray(_w_exp(np.asarray(x, dtype=object)), dtype=object)
+
+
+# ufunc of w_exp, built on first use so that importing doesn't load numpy
+_w_exp = None
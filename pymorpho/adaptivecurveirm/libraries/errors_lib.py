@@ -1,3 +1,5 @@
 class ErrorsLib:
     ZERO_ADDRESS = "zero address"
     NOT_MORPHO = "not Morpho"
+    INVALID_CURVE_STEEPNESS = "invalid curve steepness"
+    INVALID_TARGET_UTILIZATION = "invalid target utilization"
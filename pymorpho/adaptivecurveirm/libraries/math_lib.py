@@ -3,7 +3,12 @@ WAD_INT = 10**18
 
 class MathLib:
     def w_mul_to_zero(a: int, b: int) -> int:
-        return a * b // WAD_INT
+        return MathLib.div_to_zero(a * b, WAD_INT)
 
     def w_div_to_zero(a: int, b: int) -> int:
-        return a * WAD_INT // b
+        return MathLib.div_to_zero(a * WAD_INT, b)
+
+    def div_to_zero(a: int, b: int) -> int:
+        # signed division of solidity, which rounds towards zero where // floors
+        quotient = abs(a) // abs(b)
+        return -quotient if (a < 0) != (b < 0) else quotient
@@ -22,3 +22,6 @@ class ErrorsLib:
     TRANSFER_FROM_REVERTED = "transferFrom reverted"
     TRANSFER_FROM_RETURNED_FALSE = "transferFrom returned false"
     MAX_UINT128_EXCEEDED = "max uint128 exceeded"
+    LIQUIDATION_INDEX_DISABLED = "liquidation index disabled"
+    NESTED_MULTICALL = "nested multicall"
+    UNKNOWN_FUNCTION = "unknown function"
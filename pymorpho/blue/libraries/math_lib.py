@@ -1,6 +1,12 @@
+from __future__ import annotations
 from .errors_lib import ErrorsLib
+from pymorpho.utils.lazy import lazy_import
+
+np = lazy_import("numpy")
 
 WAD = 10**18
+_TWO_WAD = 2 * WAD
+_THREE_WAD = 3 * WAD
 
 
 class MathLib:
@@ -20,7 +26,26 @@ class MathLib:
         return (x * y + (d - 1)) // d
 
     def w_taylor_compounded(x: int, n: int) -> int:
+        # mul_div_down inlined, this runs on every accrual
         first_term = x * n
-        second_term = MathLib.mul_div_down(first_term, first_term, 2 * WAD)
-        third_term = MathLib.mul_div_down(second_term, first_term, 3 * WAD)
+        second_term = first_term * first_term // _TWO_WAD
+        third_term = second_term * first_term // _THREE_WAD
+        return first_term + second_term + third_term
+
+    def w_taylor_compounded_many(
+        x: np.ndarray, n: np.ndarray, exact: bool = True
+    ) -> np.ndarray:
+        """
+        `w_taylor_compounded` of each pair of elements of `x` and `n`. With
+        `exact`, returns an object array of exact ints. Otherwise computes the
+        same terms in float64, in the same WAD units.
+        """
+        dtype = object if exact else np.float64
+        first_term = np.asarray(x, dtype=dtype) * np.asarray(n, dtype=dtype)
+        if exact:
+            second_term = first_term * first_term // _TWO_WAD
+            third_term = second_term * first_term // _THREE_WAD
+        else:
+            second_term = first_term * first_term / (2 * WAD)
+            third_term = second_term * first_term / (3 * WAD)
         return first_term + second_term + third_term
@@ -0,0 +1,232 @@
+from pymorpho.blue.libraries.constants_lib import ConstantsLib
+from pymorpho.blue.libraries.math_lib import MathLib, WAD
+from pymorpho.blue.libraries.shares_math_lib import (
+    SharesMathLib,
+    VIRTUAL_ASSETS,
+    VIRTUAL_SHARES,
+)
+from pymorpho.utils.Mixer import Address
+from pymorpho.utils.storage import Layered
+from bisect import bisect_left, bisect_right
+from typing import Optional, Tuple
+
+# liquidation price of a position without collateral, always crossed
+INFINITE_PRICE = 2**512
+
+
+def liquidation_price(
+    borrow_shares: int,
+    collateral: int,
+    total_borrow_assets: int,
+    total_borrow_shares: int,
+    lltv: int,
+) -> int:
+    """
+    Lowest collateral price at which the position passes `MorphoBlue._is_healthy`,
+    computed exactly: the position is unhealthy if and only if the oracle price
+    is strictly below it.
+    """
+    borrowed = SharesMathLib.to_assets_up(
+        borrow_shares, total_borrow_assets, total_borrow_shares
+    )
+    if borrowed == 0:
+        return 0
+    # collateral is negative if a liquidation seized more than the position had
+    if collateral <= 0 or lltv == 0:
+        return INFINITE_PRICE
+    # max_borrow >= borrowed <=> collateral * price >= min_value * ORACLE_PRICE_SCALE
+    min_value = MathLib.mul_div_up(borrowed, WAD, lltv)
+    return MathLib.mul_div_up(min_value, ConstantsLib.ORACLE_PRICE_SCALE, collateral)
+
+
+class _Market:
+    """Borrowers of one market sorted by liquidation price."""
+
+    __slots__ = ("lltv", "reference", "keys", "users", "positions", "dust")
+
+    def __init__(self, lltv: int, total_borrow_assets: int, total_borrow_shares: int):
+        self.lltv = lltv
+        # market totals the keys are computed with
+        self.reference: Tuple[int, int] = (total_borrow_assets, total_borrow_shares)
+        self.keys: list[int] = []
+        self.users: list[Address] = []
+        # user -> (borrow shares, collateral, key)
+        self.positions: dict[Address, Tuple[int, int, int]] = {}
+        # borrowers too small for the rounding bounds of the sorted keys
+        self.dust: set[Address] = set()
+
+    def copy(self) -> "_Market":
+        market = _Market(self.lltv, *self.reference)
+        market.keys = self.keys.copy()
+        market.users = self.users.copy()
+        market.positions = self.positions.copy()
+        market.dust = self.dust.copy()
+        return market
+
+    def remove(self, user: Address):
+        _, _, key = self.positions.pop(user)
+        if user in self.dust:
+            self.dust.discard(user)
+            return
+        i = bisect_left(self.keys, key)
+        while self.users[i] != user:
+            i += 1
+        del self.keys[i]
+        del self.users[i]
+
+    def insert(self, user: Address, borrow_shares: int, collateral: int):
+        key = liquidation_price(borrow_shares, collateral, *self.reference, self.lltv)
+        self.positions[user] = (borrow_shares, collateral, key)
+        borrowed = SharesMathLib.to_assets_up(borrow_shares, *self.reference)
+        if borrowed < LiquidationIndex.DUST or key < LiquidationIndex.DUST:
+            self.dust.add(user)
+            return
+        i = bisect_right(self.keys, key)
+        self.keys.insert(i, key)
+        self.users.insert(i, user)
+
+    def to_reference(self, price: int, total_borrow_assets: int, total_borrow_shares: int) -> int:
+        """Converts a price at the given totals into the frame of the keys."""
+        reference_assets, reference_shares = self.reference
+        return MathLib.mul_div_down(
+            price,
+            (reference_assets + VIRTUAL_ASSETS) * (total_borrow_shares + VIRTUAL_SHARES),
+            (reference_shares + VIRTUAL_SHARES) * (total_borrow_assets + VIRTUAL_ASSETS),
+        )
+
+
+class LiquidationIndex(Layered):
+    """
+    Per market index of the borrowers of `MorphoBlue` ordered by the collateral
+    price at which they become unhealthy.
+
+    Keys are exact liquidation prices computed with the market totals of the
+    moment the market was indexed, so accruing interest doesn't touch the
+    index: queries convert their price into that frame instead. The share
+    price rounding makes the converted keys exact up to a relative `MARGIN`,
+    so the keys within the margin of a query price, along with the few dust
+    positions for which the bound doesn't hold, are checked exactly. A query
+    costs O(log n + k) for k positions returned.
+    """
+
+    __slots__ = ("_markets", "_owned", "_undo")
+
+    # positions owing less than this many assets are always checked exactly
+    DUST = 10**6
+    # relative error bound of a key converted to other market totals, in WAD
+    MARGIN = 10**14
+
+    def __init__(
+        self,
+        markets: dict[bytes, _Market] = None,
+        owned: set[bytes] = None,
+        undo: dict[Tuple[bytes, Address], Optional[Tuple[int, int]]] = None,
+    ):
+        self._markets: dict[bytes, _Market] = {} if markets is None else markets
+        # markets whose entries aren't shared with another branch
+        self._owned: set[bytes] = set(self._markets) if owned is None else owned
+        # journal of the borrowers updated by the open transaction
+        self._undo = undo
+
+    def _market(self, id: bytes) -> Optional[_Market]:
+        market = self._markets.get(id)
+        if market is not None and id not in self._owned:
+            market = self._markets[id] = market.copy()
+            self._owned.add(id)
+        return market
+
+    def update(
+        self,
+        id: bytes,
+        user: Address,
+        borrow_shares: int,
+        collateral: int,
+        lltv: int,
+        total_borrow_assets: int,
+        total_borrow_shares: int,
+    ):
+        market = self._market(id)
+        if market is None:
+            market = self._markets[id] = _Market(
+                lltv, total_borrow_assets, total_borrow_shares
+            )
+            self._owned.add(id)
+        previous = market.positions.get(user)
+        if self._undo is not None and (id, user) not in self._undo:
+            self._undo[(id, user)] = None if previous is None else previous[:2]
+        if previous is not None:
+            market.remove(user)
+        if borrow_shares > 0:
+            market.insert(user, borrow_shares, collateral)
+
+    def crossed(
+        self,
+        id: bytes,
+        price: int,
+        previous_price: int,
+        total_borrow_assets: int,
+        total_borrow_shares: int,
+    ) -> list[Address]:
+        """
+        Borrowers unhealthy at `price` that were healthy at `previous_price`,
+        given the current borrow totals of the market. With `previous_price`
+        set to `INFINITE_PRICE`, returns every unhealthy borrower.
+        """
+        market = self._markets.get(id)
+        if market is None or price >= previous_price:
+            return []
+        low = MathLib.w_mul_down(
+            market.to_reference(price, total_borrow_assets, total_borrow_shares),
+            WAD - LiquidationIndex.MARGIN,
+        )
+        start = bisect_right(market.keys, low)
+        if previous_price >= INFINITE_PRICE:
+            end = len(market.keys)
+        else:
+            high = MathLib.mul_div_up(
+                market.to_reference(
+                    previous_price, total_borrow_assets, total_borrow_shares
+                ),
+                WAD + LiquidationIndex.MARGIN,
+                WAD,
+            )
+            end = bisect_right(market.keys, high)
+
+        crossed = []
+        for user in (*market.users[start:end], *market.dust):
+            borrow_shares, collateral, _ = market.positions[user]
+            threshold = liquidation_price(
+                borrow_shares,
+                collateral,
+                total_borrow_assets,
+                total_borrow_shares,
+                market.lltv,
+            )
+            if price < threshold <= previous_price:
+                crossed.append(user)
+        return crossed
+
+    def __len__(self) -> int:
+        return sum(len(market.positions) for market in self._markets.values())
+
+    def child(self) -> "LiquidationIndex":
+        return LiquidationIndex(dict(self._markets), set())
+
+    def sibling(self) -> "LiquidationIndex":
+        return LiquidationIndex(dict(self._markets), set())
+
+    def layer(self) -> "LiquidationIndex":
+        return LiquidationIndex(self._markets, self._owned, {})
+
+    def merge(self, layer: "LiquidationIndex"):
+        if self._undo is not None:
+            for key, saved in layer._undo.items():
+                self._undo.setdefault(key, saved)
+
+    def discard(self, layer: "LiquidationIndex"):
+        for (id, user), saved in reversed(layer._undo.items()):
+            market = self._market(id)
+            if user in market.positions:
+                market.remove(user)
+            if saved is not None and saved[0] > 0:
+                market.insert(user, *saved)
@@ -1,13 +1,26 @@
-from pymorpho.utils.Mixer import Mixer, Metadata, ChainID, Address, InstanceType
-from pymorpho.blue.types import MarketParams, Market, Position
+from __future__ import annotations
+from pymorpho.utils.Mixer import Mixer, Metadata, ChainID, Address, InstanceType, World
+from pymorpho.blue.types import (
+    Action,
+    MarketParams,
+    Market,
+    Position,
+    UnhealthyPosition,
+)
 from pymorpho.blue.libraries.errors_lib import ErrorsLib
 from pymorpho.blue.libraries.constants_lib import ConstantsLib
 from pymorpho.blue.libraries.math_lib import MathLib, WAD
 from pymorpho.blue.libraries.shares_math_lib import SharesMathLib
 from pymorpho.blue.libraries.utils_lib import UtilsLib
-from dataclasses import dataclass
-from collections import defaultdict
+from dataclasses import dataclass, replace
+from pymorpho.blue.position_store import ColumnarPositionStore
+from pymorpho.blue.liquidation_index import LiquidationIndex, INFINITE_PRICE
+from pymorpho.utils.storage import Memo, Storage, Versions
+from itertools import chain
 from typing import Tuple, Any
+from pymorpho.utils.lazy import lazy_import
+
+np = lazy_import("numpy")
 
 
 class MorphoBlue:
@@ -17,40 +30,58 @@ class MorphoBlue:
         metadata: Metadata = Metadata(
             ChainID.ETH_MAINNET, Mixer.ZERO_ADDRESS, "MorphoBlue", InstanceType.CONTRACT
         ),
-        sender = Mixer.ZERO_ADDRESS
+        sender = Mixer.ZERO_ADDRESS,
+        world: World = Mixer.world,
+        columnar_positions: bool = False,
+        liquidation_index: bool = False,
     ):
         # owner
         self._owner: Address = Mixer.ZERO_ADDRESS
         # fee recipient
         self._fee_recipient: Address = Mixer.ZERO_ADDRESS
-        # dictionary of position for each market (id, address) -> Position
-        self._position: defaultdict[Tuple[bytes, Address], Position] = defaultdict(
-            Position
+        # dictionary of position for each market (id, address) -> Position,
+        # optionally stored as one set of columns per market
+        self._position: Storage[Tuple[bytes, Address], Position] = (
+            ColumnarPositionStore() if columnar_positions else Storage(Position)
         )
         # dictionary of the markets id -> Market
-        self._market: defaultdict[bytes, Market] = defaultdict(Market)
+        self._market: Storage[bytes, Market] = Storage(Market)
+        # version of each market, bumped by every entry point writing to it,
+        # so that readers can tell which markets changed since they last looked
+        self._market_version: Versions = Versions()
         # whether an irm is enabled
-        self._is_irm_enabled: defaultdict[Address, bool] = defaultdict(bool)
+        self._is_irm_enabled: Storage[Address, bool] = Storage(bool)
         # whether a lltv is enabled int -> bool
-        self._is_lltv_enabled: defaultdict[Address, bool] = defaultdict(bool)
+        self._is_lltv_enabled: Storage[Address, bool] = Storage(bool)
         # authorizations
-        self._is_authorized: defaultdict[Tuple[Address, Address], bool] = defaultdict(
+        self._is_authorized: Storage[Tuple[Address, Address], bool] = Storage(
             bool
         )
         # nonces
-        self._nonce: defaultdict[Address, int] = defaultdict(int)
+        self._nonce: Storage[Address, int] = Storage(int)
         # dictionary of the market parameters
-        self._id_to_market_params: defaultdict[bytes, MarketParams] = defaultdict(
+        self._id_to_market_params: Storage[bytes, MarketParams] = Storage(
             MarketParams
         )
 
+        # expected balances of each market, keyed by the block timestamp and
+        # the market state they were computed at
+        self._expected_balances: Memo = Memo()
+        # oracle prices read by the running multicall, None outside of one
+        self._bundle_prices: dict[Address, int] = None
+        # borrowers of each market sorted by liquidation price, if enabled
+        self._liquidation_index: LiquidationIndex = (
+            LiquidationIndex() if liquidation_index else None
+        )
+
         self._owner = owner
 
         # Utility stuff
-        self.metadata = metadata
+        self.metadata = replace(metadata)
+        self.world = world
     
     def deploy(self) -> Address:
-        self.metadata.address = Mixer.register(self)
+        self.metadata.address = self.world.register(self)
         return self.metadata.address
     
     def _only_owner(self, sender):
@@ -66,7 +97,7 @@ class MorphoBlue:
 
     def enable_lltv(self, lltv: int, sender=Mixer.ZERO_ADDRESS):
         self._only_owner(sender)
-        assert not (self._is_lltv_enabled[lltv]), ErrorsLib.ALREADY_SET
+        assert not (self._is_lltv_enabled.read(lltv)), ErrorsLib.ALREADY_SET
         assert lltv < WAD, ErrorsLib.MAX_LLTV_EXCEEDED
 
         self._is_lltv_enabled[lltv] = True
@@ -77,7 +108,7 @@ class MorphoBlue:
     ):
         self._only_owner(sender)
         id = market_params.id()
-        assert self._market[id].last_update != 0, ErrorsLib.MARKET_NOT_CREATED
+        assert self._market.read(id).last_update != 0, ErrorsLib.MARKET_NOT_CREATED
         assert new_fee <= ConstantsLib.MAX_FEE, ErrorsLib.MAX_FEE_EXCEEDED
         self._accrue_interest(market_params, id)
         self._market[id].fee = new_fee
@@ -93,11 +124,12 @@ class MorphoBlue:
     def create_market(self, market_params: MarketParams, sender=Mixer.ZERO_ADDRESS):
         id: bytes = market_params.id()
 
-        assert self._is_irm_enabled[market_params.irm], ErrorsLib.IRM_NOT_ENABLED
-        assert self._is_lltv_enabled[market_params.lltv], ErrorsLib.LLTV_NOT_ENABLED
-        assert self._market[id].last_update == 0, ErrorsLib.MARKET_ALREADY_CREATED
+        assert self._is_irm_enabled.read(market_params.irm), ErrorsLib.IRM_NOT_ENABLED
+        assert self._is_lltv_enabled.read(market_params.lltv), ErrorsLib.LLTV_NOT_ENABLED
+        assert self._market.read(id).last_update == 0, ErrorsLib.MARKET_ALREADY_CREATED
 
-        self._market[id].last_update = Mixer.block_timestamp(self.metadata.chain)
+        self._market[id].last_update = self.world.block_timestamp(self.metadata.chain)
+        self._market_version.bump(id)
         self._id_to_market_params[id] = market_params
         # TODO: emit event ?
 
@@ -111,7 +143,7 @@ class MorphoBlue:
         sender=Mixer.ZERO_ADDRESS,
     ) -> Tuple[int, int]:
         id: bytes = market_params.id()
-        assert self._market[id].last_update != 0, ErrorsLib.MARKET_NOT_CREATED
+        assert self._market.read(id).last_update != 0, ErrorsLib.MARKET_NOT_CREATED
         assert UtilsLib.exactly_one_zero(assets, shares), ErrorsLib.INCONSISTENT_INPUT
         assert on_behalf != Mixer.ZERO_ADDRESS, ErrorsLib.ZERO_ADDRESS
 
@@ -127,7 +159,9 @@ class MorphoBlue:
             )
         else:
             assets = SharesMathLib.to_assets_up(
-                shares, self._market[id].total_supply_assets, self.total_supply_shares
+                shares,
+                self._market[id].total_supply_assets,
+                self._market[id].total_supply_shares,
             )
 
         self._position[(id, on_behalf)].supply_shares = (
@@ -142,11 +176,11 @@ class MorphoBlue:
 
         # performing callback, sender needs to implement the on_morpho_supply function
         if data is not None:
-            Mixer.contracts_and_eoas[sender].on_morpho_supply(
+            self.world.contracts_and_eoas[sender].on_morpho_supply(
                 assets, data, self.metadata.address
             )
 
-        Mixer.contracts_and_eoas[market_params.loan_token].safe_transfer_from(
+        self.world.contracts_and_eoas[market_params.loan_token].safe_transfer_from(
             sender, self.metadata.address, assets, self.metadata.address
         )
         return assets, shares
@@ -161,7 +195,7 @@ class MorphoBlue:
         sender=Mixer.ZERO_ADDRESS,
     ) -> Tuple[int, int]:
         id: bytes = market_params.id()
-        assert self._market[id].last_update != 0, ErrorsLib.MARKET_NOT_CREATED
+        assert self._market.read(id).last_update != 0, ErrorsLib.MARKET_NOT_CREATED
         assert UtilsLib.exactly_one_zero(assets, shares), ErrorsLib.INCONSISTENT_INPUT
         assert receiver != Mixer.ZERO_ADDRESS, ErrorsLib.ZERO_ADDRESS
         assert self._is_sender_authorized(on_behalf, sender), ErrorsLib.NOT_AUTHORIZED
@@ -175,7 +209,9 @@ class MorphoBlue:
             )
         else:
             assets = SharesMathLib.to_assets_down(
-                shares, self._market[id].total_supply_assets, self.total_supply_shares
+                shares,
+                self._market[id].total_supply_assets,
+                self._market[id].total_supply_shares,
             )
 
         # TODO: check that they don't go negative
@@ -195,7 +231,7 @@ class MorphoBlue:
 
         # TODO: emit event ?
 
-        Mixer.contracts_and_eoas[market_params.loan_token].safe_transfer(
+        self.world.contracts_and_eoas[market_params.loan_token].safe_transfer(
             receiver, assets, self.metadata.address
         )
 
@@ -211,7 +247,7 @@ class MorphoBlue:
         sender=Mixer.ZERO_ADDRESS,
     ) -> Tuple[int, int]:
         id: bytes = market_params.id()
-        assert self._market[id].last_update != 0, ErrorsLib.MARKET_NOT_CREATED
+        assert self._market.read(id).last_update != 0, ErrorsLib.MARKET_NOT_CREATED
         assert UtilsLib.exactly_one_zero(assets, shares), ErrorsLib.INCONSISTENT_INPUT
         assert receiver != Mixer.ZERO_ADDRESS, ErrorsLib.ZERO_ADDRESS
         assert self._is_sender_authorized(on_behalf, sender), ErrorsLib.NOT_AUTHORIZED
@@ -226,7 +262,9 @@ class MorphoBlue:
             )
         else:
             assets = SharesMathLib.to_assets_down(
-                shares, self._market[id].total_borrow_assets, self.total_borrow_shares
+                shares,
+                self._market[id].total_borrow_assets,
+                self._market[id].total_borrow_shares,
             )
 
         self._position[(id, on_behalf)].borrow_shares = (
@@ -238,6 +276,7 @@ class MorphoBlue:
         self._market[id].total_borrow_shares = (
             self._market[id].total_borrow_shares + shares
         )
+        self._index_position(market_params, id, on_behalf)
 
         assert self._is_healthy(
             market_params, id, on_behalf
@@ -247,7 +286,7 @@ class MorphoBlue:
         ), ErrorsLib.INSUFFICIENT_LIQUIDITY
 
         # TODO: emit event ?
-        Mixer.contracts_and_eoas[market_params.loan_token].safe_transfer(
+        self.world.contracts_and_eoas[market_params.loan_token].safe_transfer(
             receiver, assets, self.metadata.address
         )
 
@@ -263,7 +302,7 @@ class MorphoBlue:
         sender=Mixer.ZERO_ADDRESS,
     ) -> Tuple[int, int]:
         id: bytes = market_params.id()
-        assert self._market[id].last_update != 0, ErrorsLib.MARKET_NOT_CREATED
+        assert self._market.read(id).last_update != 0, ErrorsLib.MARKET_NOT_CREATED
         assert UtilsLib.exactly_one_zero(assets, shares), ErrorsLib.INCONSISTENT_INPUT
         assert on_behalf != Mixer.ZERO_ADDRESS, ErrorsLib.ZERO_ADDRESS
 
@@ -278,12 +317,14 @@ class MorphoBlue:
             )
         else:
             assets = SharesMathLib.to_assets_up(
-                shares, self._market[id].total_borrow_assets, self.total_borrow_shares
+                shares,
+                self._market[id].total_borrow_assets,
+                self._market[id].total_borrow_shares,
             )
 
         # TODO: check they don't go negative
         self._position[(id, on_behalf)].borrow_shares = (
-            self._position[(id, on_behalf)].borrow_share - shares
+            self._position[(id, on_behalf)].borrow_shares - shares
         )
         self._market[id].total_borrow_shares = (
             self._market[id].total_borrow_shares - shares
@@ -291,13 +332,14 @@ class MorphoBlue:
         self._market[id].total_borrow_assets = UtilsLib.zero_floor_sub(
             self._market[id].total_borrow_assets, assets
         )
+        self._index_position(market_params, id, on_behalf)
 
         if data is not None:
-            Mixer.contracts_and_eoas[sender].on_morpho_repay(
+            self.world.contracts_and_eoas[sender].on_morpho_repay(
                 assets, data, self.metadata.address
             )
 
-        Mixer.contracts_and_eoas[market_params.loan_token].safe_transfer_from(
+        self.world.contracts_and_eoas[market_params.loan_token].safe_transfer_from(
             sender, self.metadata.address, assets, self.metadata.address
         )
 
@@ -312,7 +354,7 @@ class MorphoBlue:
         sender=Mixer.ZERO_ADDRESS,
     ) -> Tuple[int, int]:
         id: bytes = market_params.id()
-        assert self._market[id].last_update != 0, ErrorsLib.MARKET_NOT_CREATED
+        assert self._market.read(id).last_update != 0, ErrorsLib.MARKET_NOT_CREATED
         assert assets > 0, ErrorsLib.ZERO_ASSETS
         assert on_behalf != Mixer.ZERO_ADDRESS, ErrorsLib.ZERO_ADDRESS
         # TODO: add other asserts
@@ -320,13 +362,14 @@ class MorphoBlue:
         self._position[(id, on_behalf)].collateral = (
             self._position[(id, on_behalf)].collateral + assets
         )
+        self._index_position(market_params, id, on_behalf)
 
         # TODO: emit event ?
         if data is not None:
-            Mixer.contracts_and_eoas[sender].on_morpho_supply_collateral(
+            self.world.contracts_and_eoas[sender].on_morpho_supply_collateral(
                 assets, data, self.metadata.address
             )
-        Mixer.contracts_and_eoas[market_params.collateral_token].safe_transfer_from(
+        self.world.contracts_and_eoas[market_params.collateral_token].safe_transfer_from(
             sender, self.metadata.address, assets, self.metadata.address
         )
 
@@ -339,7 +382,7 @@ class MorphoBlue:
         sender=Mixer.ZERO_ADDRESS,
     ):
         id = market_params.id()
-        assert self._market[id].last_update != 0, ErrorsLib.MARKET_NOT_CREATED
+        assert self._market.read(id).last_update != 0, ErrorsLib.MARKET_NOT_CREATED
         assert assets > 0, ErrorsLib.ZERO_ASSETS
         assert receiver != Mixer.ZERO_ADDRESS, ErrorsLib.ZERO_ADDRESS
         assert self._is_sender_authorized(on_behalf, sender), ErrorsLib.NOT_AUTHORIZED
@@ -352,6 +395,7 @@ class MorphoBlue:
         self._position[(id, on_behalf)].collateral = (
             self._position[(id, on_behalf)].collateral - assets
         )
+        self._index_position(market_params, id, on_behalf)
 
         assert self._is_healthy(
             market_params, id, on_behalf
@@ -359,7 +403,7 @@ class MorphoBlue:
 
         # TODO: emit event ?
 
-        Mixer.contracts_and_eoas[market_params.collateral_token].safe_transfer(
+        self.world.contracts_and_eoas[market_params.collateral_token].safe_transfer(
             receiver, assets, self.metadata.address
         )
 
@@ -373,31 +417,22 @@ class MorphoBlue:
         sender=Mixer.ZERO_ADDRESS,
     ):
         id = market_params.id()
-        assert self._market[id].last_update != 0, ErrorsLib.MARKET_NOT_CREATED
+        assert self._market.read(id).last_update != 0, ErrorsLib.MARKET_NOT_CREATED
         assert UtilsLib.exactly_one_zero(
             seized_assets, repaid_shares
         ), ErrorsLib.INCONSISTENT_INPUT
 
         self._accrue_interest(market_params, id)
 
-        collateral_price = Mixer.contracts_and_eoas[market_params.oracle].price(
-            self.metadata.address
-        )
+        collateral_price = self._collateral_price(market_params)
 
         assert not (
             self._is_healthy(market_params, id, borrower)
         ), ErrorsLib.HEALTHY_POSITION
 
         repaid_assets = 0
-        liquidation_incentive_factor = UtilsLib.min(
-            ConstantsLib.MAX_LIQUIDATION_INCENTIVE_FACTOR,
-            MathLib.w_div_down(
-                WAD,
-                WAD
-                - MathLib.w_mul_down(
-                    ConstantsLib.LIQUIDATION_CURSOR, WAD - market_params.lltv
-                ),
-            ),
+        liquidation_incentive_factor = self._liquidation_incentive_factor(
+            market_params.lltv
         )
 
         if seized_assets > 0:
@@ -413,7 +448,7 @@ class MorphoBlue:
                 self._market[id].total_borrow_shares,
             )
         else:
-            repaid_shares = SharesMathLib.to_assets_up(
+            repaid_assets = SharesMathLib.to_assets_up(
                 repaid_shares,
                 self._market[id].total_borrow_assets,
                 self._market[id].total_borrow_shares,
@@ -463,35 +498,94 @@ class MorphoBlue:
             )
             self._position[(id, borrower)].borrow_shares = 0
 
+        self._index_position(market_params, id, borrower)
+
         # TODO: add the transfer
-        Mixer.contracts_and_eoas[market_params.collateral_token].safe_transfer(
+        self.world.contracts_and_eoas[market_params.collateral_token].safe_transfer(
             sender, seized_assets, self.metadata.address
         )
 
         if data is not None:
-            Mixer.contracts_and_eoas[sender].on_morpho_liquidate(
+            self.world.contracts_and_eoas[sender].on_morpho_liquidate(
                 repaid_assets, data, self.metadata.address
             )
 
-        Mixer.contracts_and_Eoas[market_params.loan_token].safe_transfer_from(
+        self.world.contracts_and_eoas[market_params.loan_token].safe_transfer_from(
             sender, self.metadata.address, repaid_assets, self.metadata.address
         )
 
         return seized_assets, repaid_assets
 
+    def _liquidation_incentive_factor(self, lltv: int) -> int:
+        return UtilsLib.min(
+            ConstantsLib.MAX_LIQUIDATION_INCENTIVE_FACTOR,
+            MathLib.w_div_down(
+                WAD,
+                WAD - MathLib.w_mul_down(ConstantsLib.LIQUIDATION_CURSOR, WAD - lltv),
+            ),
+        )
+
     def flash_loan(
         self, token: Address, assets: int, data: Any = None, sender=Mixer.ZERO_ADDRESS
     ):
-        Mixer.contracts_and_eoas[token].safe_transfer(
+        self.world.contracts_and_eoas[token].safe_transfer(
             sender, assets, self.metadata.address
         )
-        Mixer.contracts_and_eoas[sender].on_morpho_flash_loan(
+        self.world.contracts_and_eoas[sender].on_morpho_flash_loan(
             assets, data, self.metadata.address
         )
-        Mixer.contracts_and_eoas[token].safe_transfer_from(
+        self.world.contracts_and_eoas[token].safe_transfer_from(
             sender, self.metadata.address, assets, self.metadata.address
         )
 
+    def multicall(
+        self, actions: list[Action], sender=Mixer.ZERO_ADDRESS
+    ) -> list[Any]:
+        """
+        Runs `actions` on behalf of `sender` as one atomic bundle: if one of
+        them fails, none of them is applied. Every market the actions touch is
+        validated and accrued once up front, and each oracle is read once for
+        the whole bundle. Returns the result of each action.
+        """
+        assert self._bundle_prices is None, ErrorsLib.NESTED_MULTICALL
+        for action in actions:
+            assert action.function in Action.FUNCTIONS, ErrorsLib.UNKNOWN_FUNCTION
+
+        with self.world.transaction():
+            self._bundle_prices = {}
+            try:
+                accrued = set()
+                for action in actions:
+                    market_params = action.args[0]
+                    id = market_params.id()
+                    if id in accrued:
+                        continue
+                    assert (
+                        self._market.read(id).last_update != 0
+                    ), ErrorsLib.MARKET_NOT_CREATED
+                    self._accrue_interest(market_params, id)
+                    accrued.add(id)
+
+                return [
+                    getattr(self, action.function)(*action.args, sender=sender)
+                    for action in actions
+                ]
+            finally:
+                self._bundle_prices = None
+
+    def _collateral_price(self, market_params: MarketParams) -> int:
+        if self._bundle_prices is None:
+            return self.world.contracts_and_eoas[market_params.oracle].price(
+                self.metadata.address
+            )
+        price = self._bundle_prices.get(market_params.oracle)
+        if price is None:
+            price = self.world.contracts_and_eoas[market_params.oracle].price(
+                self.metadata.address
+            )
+            self._bundle_prices[market_params.oracle] = price
+        return price
+
     # TODO: implement later
     def set_authorization(self, authorized: str, new_is_authorized: bool):
         pass
@@ -501,22 +595,24 @@ class MorphoBlue:
         pass
 
     def _is_sender_authorized(self, on_behalf: Address, sender=Mixer.ZERO_ADDRESS):
-        return sender == on_behalf or self._is_authorized[(on_behalf, sender)]
+        return sender == on_behalf or self._is_authorized.read((on_behalf, sender))
 
     def accrue_interest(self, market_params: MarketParams, sender: Mixer.ZERO_ADDRESS):
         id = market_params.id()
-        assert self._market[id].last_update != 0, ErrorsLib.MARKET_NOT_CREATED
+        assert self._market.read(id).last_update != 0, ErrorsLib.MARKET_NOT_CREATED
         self._accrue_interest(market_params, id)
 
     def _accrue_interest(self, market_params: MarketParams, id: bytes):
+        # every entry point writing to a market accrues it first
+        self._market_version.bump(id)
         elapsed: int = (
-            Mixer.block_timestamp(self.metadata.chain) - self._market[id].last_update
+            self.world.block_timestamp(self.metadata.chain) - self._market[id].last_update
         )
 
         if elapsed == 0:
             return
 
-        borrow_rate = Mixer.contracts_and_eoas[market_params.irm].borrow_rate(
+        borrow_rate = self.world.contracts_and_eoas[market_params.irm].borrow_rate(
             market_params, self._market[id], self.metadata.address
         )
         interest = MathLib.w_mul_down(
@@ -548,7 +644,73 @@ class MorphoBlue:
             )
 
         # TODO: add emit event ?
-        self._market[id].last_update = Mixer.block_timestamp(self.metadata.chain)
+        self._market[id].last_update = self.world.block_timestamp(self.metadata.chain)
+
+    def fast_forward(self, start: int, end: int, granularity: int):
+        """
+        Accrues the interest of every market at each `granularity` seconds
+        from `start` and at `end`, with the exact same results as setting the
+        block timestamp and calling `accrue_interest` on each market at each
+        step. Called by `World.advance_to`.
+
+        Markets of an `AdaptiveCurveIRM` are evolved on plain integers and
+        written back once, the others are stepped through `_accrue_interest`.
+        """
+        if end <= start:
+            return
+        for id, market_params in list(self._id_to_market_params.items()):
+            irm = self.world.contracts_and_eoas.get(market_params.irm)
+            borrow_rate_at = getattr(irm, "_borrow_rate_at", None)
+            steps = chain(range(start + granularity, end, granularity), (end,))
+            if borrow_rate_at is None:
+                for timestamp in steps:
+                    self.world.set_block_timestamp(timestamp, self.metadata.chain)
+                    self._accrue_interest(market_params, id)
+                continue
+
+            market = self._market[id]
+            rate_at_target = irm.rate_at_target.read(id)
+            total_supply_assets = market.total_supply_assets
+            total_supply_shares = market.total_supply_shares
+            total_borrow_assets = market.total_borrow_assets
+            last_update = market.last_update
+            fee = market.fee
+            fee_shares = 0
+            for timestamp in steps:
+                elapsed = timestamp - last_update
+                if elapsed == 0:
+                    continue
+                borrow_rate, rate_at_target = borrow_rate_at(
+                    rate_at_target, total_borrow_assets, total_supply_assets, elapsed
+                )
+                interest = MathLib.w_mul_down(
+                    total_borrow_assets,
+                    MathLib.w_taylor_compounded(borrow_rate, elapsed),
+                )
+                total_borrow_assets += interest
+                total_supply_assets += interest
+                if fee > 0:
+                    fee_amount = MathLib.w_mul_down(interest, fee)
+                    shares = SharesMathLib.to_shares_down(
+                        fee_amount,
+                        total_supply_assets - fee_amount,
+                        total_supply_shares,
+                    )
+                    fee_shares += shares
+                    total_supply_shares += shares
+                last_update = timestamp
+
+            if last_update == market.last_update:
+                continue
+            self._market_version.bump(id)
+            irm.rate_at_target[id] = rate_at_target
+            market.total_supply_assets = total_supply_assets
+            market.total_supply_shares = total_supply_shares
+            market.total_borrow_assets = total_borrow_assets
+            market.last_update = last_update
+            if fee > 0:
+                position = self._position[(id, self._fee_recipient)]
+                position.supply_shares = position.supply_shares + fee_shares
 
     def _is_healthy(
         self,
@@ -556,26 +718,265 @@ class MorphoBlue:
         id: bytes,
         borrower: Address,
     ) -> bool:
-        if self._position[(id, borrower)].borrow_shares == 0:
+        if self._position.read((id, borrower)).borrow_shares == 0:
             return True
-        collateral_price = Mixer.contracts_and_eoas[market_params.oracle].price(
-            self.metadata.address
-        )
+        collateral_price = self._collateral_price(market_params)
 
         borrowed = SharesMathLib.to_assets_up(
-            self._position[(id, borrower)].borrow_shares,
-            self._market[id].total_borrow_assets,
-            self._market[id].total_borrow_shares,
+            self._position.read((id, borrower)).borrow_shares,
+            self._market.read(id).total_borrow_assets,
+            self._market.read(id).total_borrow_shares,
         )
         max_borrow = MathLib.w_mul_down(
             MathLib.mul_div_down(
-                self._position[(id, borrower)].collateral,
+                self._position.read((id, borrower)).collateral,
                 collateral_price,
                 ConstantsLib.ORACLE_PRICE_SCALE,
             ),
             market_params.lltv,
         )
         return max_borrow >= borrowed
+
+    def _index_position(self, market_params: MarketParams, id: bytes, user: Address):
+        if self._liquidation_index is None:
+            return
+        self._liquidation_index.update(
+            id,
+            user,
+            self._position.read((id, user)).borrow_shares,
+            self._position.read((id, user)).collateral,
+            market_params.lltv,
+            self._market.read(id).total_borrow_assets,
+            self._market.read(id).total_borrow_shares,
+        )
+
+    def crossed_positions(
+        self,
+        market_params: MarketParams,
+        previous_price: int = INFINITE_PRICE,
+        price: int = None,
+        sender=Mixer.ZERO_ADDRESS,
+    ) -> list[Address]:
+        """
+        Borrowers of the market that are unhealthy at `price` (the oracle price
+        by default) but were healthy at `previous_price`, at the expected
+        market balances. Leaving out `previous_price` returns every unhealthy
+        borrower. Requires the liquidation index.
+        """
+        assert (
+            self._liquidation_index is not None
+        ), ErrorsLib.LIQUIDATION_INDEX_DISABLED
+        if price is None:
+            price = self._collateral_price(market_params)
+        _, _, total_borrow_assets, total_borrow_shares = self.expected_market_balances(
+            market_params
+        )
+        return self._liquidation_index.crossed(
+            market_params.id(),
+            price,
+            previous_price,
+            total_borrow_assets,
+            total_borrow_shares,
+        )
+
+    def _positions(
+        self, ids: list[bytes]
+    ) -> dict[bytes, Tuple[list[Address], np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Returns the owners of the positions of each market of `ids` with their
+        supply shares, borrow shares and collateral as object arrays. The
+        default storage isn't indexed by market, so it is scanned once for all
+        of them.
+        """
+        if isinstance(self._position, ColumnarPositionStore):
+            return {id: self._position.arrays(id) for id in ids}
+        columns = {id: ([], [], [], []) for id in ids}
+        for (id, user), position in self._position.items():
+            market = columns.get(id)
+            if market is not None:
+                owners, supply_shares, borrow_shares, collateral = market
+                owners.append(user)
+                supply_shares.append(position.supply_shares)
+                borrow_shares.append(position.borrow_shares)
+                collateral.append(position.collateral)
+        return {
+            id: (
+                owners,
+                np.array(supply_shares, dtype=object),
+                np.array(borrow_shares, dtype=object),
+                np.array(collateral, dtype=object),
+            )
+            for id, (owners, supply_shares, borrow_shares, collateral) in columns.items()
+        }
+
+    def _are_healthy(
+        self,
+        market_params: MarketParams,
+        borrow_shares: np.ndarray,
+        collateral: np.ndarray,
+        collateral_price: int,
+        total_borrow_assets: int,
+        total_borrow_shares: int,
+    ) -> np.ndarray:
+        """Batch version of `_is_healthy` over the columns of a market."""
+        borrowed = SharesMathLib.to_assets_up(
+            borrow_shares, total_borrow_assets, total_borrow_shares
+        )
+        max_borrow = MathLib.w_mul_down(
+            MathLib.mul_div_down(
+                collateral, collateral_price, ConstantsLib.ORACLE_PRICE_SCALE
+            ),
+            market_params.lltv,
+        )
+        return ((borrow_shares == 0) | (max_borrow >= borrowed)).astype(bool)
+
+    def unhealthy_positions(
+        self,
+        market_params: MarketParams,
+        price: int = None,
+        sender=Mixer.ZERO_ADDRESS,
+    ) -> list[UnhealthyPosition]:
+        """
+        Every borrower of the market failing the `_is_healthy` check at `price`
+        (the oracle price by default) and the expected market balances, with
+        the largest liquidation `liquidate` would accept for it. Doesn't write
+        to storage. Uses the liquidation index when it is enabled.
+        """
+        return self._unhealthy_positions(market_params, price, None)
+
+    def _unhealthy_positions(
+        self,
+        market_params: MarketParams,
+        price: int,
+        positions: Tuple[list[Address], np.ndarray, np.ndarray, np.ndarray],
+    ) -> list[UnhealthyPosition]:
+        # `positions` are the columns of the market from `_positions`, read
+        # here when None
+        if price is None:
+            price = self._collateral_price(market_params)
+        id = market_params.id()
+        _, _, total_borrow_assets, total_borrow_shares = self.expected_market_balances(
+            market_params
+        )
+
+        if self._liquidation_index is not None:
+            owners = self._liquidation_index.crossed(
+                id, price, INFINITE_PRICE, total_borrow_assets, total_borrow_shares
+            )
+            borrow_shares = np.array(
+                [self._position.read((id, user)).borrow_shares for user in owners],
+                dtype=object,
+            )
+            collateral = np.array(
+                [self._position.read((id, user)).collateral for user in owners],
+                dtype=object,
+            )
+        else:
+            if positions is None:
+                positions = self._positions([id])[id]
+            owners, _, borrow_shares, collateral = positions
+            unhealthy = ~self._are_healthy(
+                market_params,
+                borrow_shares,
+                collateral,
+                price,
+                total_borrow_assets,
+                total_borrow_shares,
+            )
+            owners = [user for user, keep in zip(owners, unhealthy) if keep]
+            borrow_shares, collateral = borrow_shares[unhealthy], collateral[unhealthy]
+
+        if len(owners) == 0:
+            return []
+
+        # same formulas as `liquidate`, capped by the debt and the collateral
+        liquidation_incentive_factor = self._liquidation_incentive_factor(
+            market_params.lltv
+        )
+        debt = SharesMathLib.to_assets_up(
+            borrow_shares, total_borrow_assets, total_borrow_shares
+        )
+        seizable_for_debt = (
+            MathLib.mul_div_down(
+                MathLib.w_mul_down(debt, liquidation_incentive_factor),
+                ConstantsLib.ORACLE_PRICE_SCALE,
+                price,
+            )
+            if price > 0
+            else collateral
+        )
+        capped = seizable_for_debt >= collateral
+        seizable = np.where(capped, collateral, seizable_for_debt)
+        repaid_for_collateral = MathLib.w_div_up(
+            MathLib.mul_div_up(collateral, price, ConstantsLib.ORACLE_PRICE_SCALE),
+            liquidation_incentive_factor,
+        )
+        repaid_assets = np.where(capped, repaid_for_collateral, debt)
+        # largest repaid shares seizing at most the collateral once rounded
+        # up to assets and through the incentive: the repaid assets bound by
+        # inverting the roundings of the seized collateral exactly
+        if price > 0:
+            max_repaid_assets = (
+                (
+                    ((collateral + 1) * price - 1) // ConstantsLib.ORACLE_PRICE_SCALE
+                    + 1
+                )
+                * WAD
+                - 1
+            ) // liquidation_incentive_factor
+            max_repaid_shares = SharesMathLib.to_shares_down(
+                max_repaid_assets, total_borrow_assets, total_borrow_shares
+            )
+            max_repaid_shares = np.where(
+                max_repaid_shares < borrow_shares, max_repaid_shares, borrow_shares
+            )
+            max_repaid_shares = np.where(max_repaid_shares > 0, max_repaid_shares, 0)
+        else:
+            max_repaid_shares = np.zeros(len(owners), dtype=object)
+        repaid_shares = np.where(capped, max_repaid_shares, borrow_shares)
+        return [
+            UnhealthyPosition(*fields)
+            for fields in zip(
+                owners,
+                borrow_shares.tolist(),
+                collateral.tolist(),
+                seizable.tolist(),
+                repaid_assets.tolist(),
+                repaid_shares.tolist(),
+            )
+        ]
+
+    def unhealthy_positions_many(
+        self,
+        markets_params: list[MarketParams],
+        prices: list[int] = None,
+        sender=Mixer.ZERO_ADDRESS,
+    ) -> dict[bytes, list[UnhealthyPosition]]:
+        """
+        `unhealthy_positions` of several markets, keyed by market id. Markets
+        sharing an oracle read its price once, and without the liquidation
+        index the positions of all the markets are read in one pass.
+        """
+        if prices is None:
+            oracle_prices = {}
+            prices = []
+            for market_params in markets_params:
+                if market_params.oracle not in oracle_prices:
+                    oracle_prices[market_params.oracle] = self.world.contracts_and_eoas[
+                        market_params.oracle
+                    ].price(self.metadata.address)
+                prices.append(oracle_prices[market_params.oracle])
+        positions = (
+            self._positions([market_params.id() for market_params in markets_params])
+            if self._liquidation_index is None
+            else {}
+        )
+        return {
+            market_params.id(): self._unhealthy_positions(
+                market_params, price, positions.get(market_params.id())
+            )
+            for market_params, price in zip(markets_params, prices)
+        }
     
     # MORPHO Balances Lib
 
@@ -585,12 +986,28 @@ class MorphoBlue:
         sender = Mixer.ZERO_ADDRESS
     ) -> Tuple[int, int, int, int]:
         id = market_params.id()
-        market: Market = self._market[id]
-        elapsed = Mixer.block_timestamp(self.metadata.chain) - market.last_update
+        market: Market = self._market.read(id)
+        timestamp = self.world.block_timestamp(self.metadata.chain)
+        elapsed = timestamp - market.last_update
         total_supply_assets, total_supply_shares, total_borrow_assets, total_borrow_shares = market.total_supply_assets, market.total_supply_shares, market.total_borrow_assets, market.total_borrow_shares
 
         if elapsed > 0 and market.total_borrow_assets > 0:
-            borrow_rate = Mixer.contracts_and_eoas[market_params.irm].borrow_rate_view(
+            # any write to the market changes the key and misses the memo
+            key = (
+                timestamp,
+                total_supply_assets,
+                total_supply_shares,
+                total_borrow_assets,
+                total_borrow_shares,
+                market.last_update,
+                market.fee,
+                self.world.approximate_rates,
+            )
+            balances = self._expected_balances.get(id, key)
+            if balances is not None:
+                return balances
+
+            borrow_rate = self.world.contracts_and_eoas[market_params.irm].borrow_rate_view(
                 market_params, market
             )
             interest = MathLib.w_mul_down(
@@ -608,7 +1025,16 @@ class MorphoBlue:
                     total_supply_shares,
                 )
                 total_supply_shares += fee_shares
-            
+
+            balances = (
+                total_supply_assets,
+                total_supply_shares,
+                total_borrow_assets,
+                total_borrow_shares,
+            )
+            self._expected_balances.put(id, key, balances)
+            return balances
+
         return total_supply_assets, total_supply_shares, total_borrow_assets, total_borrow_shares
 
     def expected_total_supply_assets(
@@ -655,7 +1081,7 @@ class MorphoBlue:
         user: Address,
         sender = Mixer.ZERO_ADDRESS
     ) -> int:
-        return self._position[(id, user)].supply_shares
+        return self._position.read((id, user)).supply_shares
 
     def borrow_shares(
         self,
@@ -663,7 +1089,7 @@ class MorphoBlue:
         user: Address,
         sender = Mixer.ZERO_ADDRESS
     ) -> int:
-        return self._position[(id, user)].borrow_shares
+        return self._position.read((id, user)).borrow_shares
     
     def collateral(
         self,
@@ -671,63 +1097,63 @@ class MorphoBlue:
         user: Address,
         sender = Mixer.ZERO_ADDRESS
     ) -> int:
-        return self._position[(id, user)].collateral
+        return self._position.read((id, user)).collateral
 
     def total_supply_assets(
         self, 
         id: bytes,
         sender = Mixer.ZERO_ADDRESS
     ) -> int:
-        return self._market[id].total_supply_assets
+        return self._market.read(id).total_supply_assets
     
     def total_supply_shares(
         self, 
         id: bytes,
         sender = Mixer.ZERO_ADDRESS
     ):
-        return self._market[id].total_supply_shares
+        return self._market.read(id).total_supply_shares
 
     def total_borrow_assets(
         self, 
         id: bytes,
         sender = Mixer.ZERO_ADDRESS
     ) -> int:
-        return self._market[id].total_borrow_assets
+        return self._market.read(id).total_borrow_assets
 
     def total_borrow_shares(
         self, 
         id: bytes,
         sender = Mixer.ZERO_ADDRESS
     ) -> int:
-        return self._market[id].total_borrow_shares
+        return self._market.read(id).total_borrow_shares
 
     def last_update(
         self, 
         id: bytes,
         sender = Mixer.ZERO_ADDRESS
     ) -> int:
-        return self._market[id].last_update
+        return self._market.read(id).last_update
 
     def fee(
         self, 
         id: bytes,
         sender = Mixer.ZERO_ADDRESS
     ) -> int:
-        return self._market[id].fee
+        return self._market.read(id).fee
 
     def is_irm_enabled(
         self,
         lltv: int,
         sender = Mixer.ZERO_ADDRESS
     ) -> bool:
-        return self._is_irm_enabled[lltv]
+        return self._is_irm_enabled.read(lltv)
     
     def is_lltv_enabled(
         self,
         lltv: int,
         sender = Mixer.ZERO_ADDRESS
     ) -> bool:
-        return self._is_lltv_enabled[lltv]
+        return self._is_lltv_enabled.read(lltv)
 
     def is_authorized(
         self,
@@ -735,14 +1161,14 @@ class MorphoBlue:
         authorized: Address,
         sender = Mixer.ZERO_ADDRESS
     ) -> bool:
-        return self._is_authorized[(authorizer, authorized)]
+        return self._is_authorized.read((authorizer, authorized))
     
     def nonce(
         self,
         authorizer: Address,
         sender = Mixer.ZERO_ADDRESS
     ) -> int:
-        return self._nonce[authorizer]
+        return self._nonce.read(authorizer)
     
     # Interface
 
@@ -750,9 +1176,11 @@ class MorphoBlue:
 
     def fee_recipient(self, sender = Mixer.ZERO_ADDRESS) -> Address: return self._fee_recipient
 
-    def id_to_market_params(self, id: bytes, sender = Mixer.ZERO_ADDRESS) -> MarketParams: return self._id_to_market_params[id]
+    def id_to_market_params(self, id: bytes, sender = Mixer.ZERO_ADDRESS) -> MarketParams: return self._id_to_market_params.read(id)
     
-    def market(self, id: bytes, sender = Mixer.ZERO_ADDRESS) -> Market: return self._market[id]
+    def market(self, id: bytes, sender = Mixer.ZERO_ADDRESS) -> Market: return self._market.read(id)
+
+    def market_version(self, id: bytes, sender = Mixer.ZERO_ADDRESS) -> int: return self._market_version.get(id)
 
 
     '''
@@ -0,0 +1,208 @@
+from __future__ import annotations
+from pymorpho.utils.Mixer import Address
+from pymorpho.blue.types import Position
+from pymorpho.utils.storage import Layered
+from typing import Optional, Tuple
+from pymorpho.utils.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+
+class _Columns:
+    """Positions of one market: an address -> row index and one list per field."""
+
+    __slots__ = ("index", "owners", "supply_shares", "borrow_shares", "collateral")
+
+    def __init__(self):
+        self.index: dict[Address, int] = {}
+        self.owners: list[Address] = []
+        self.supply_shares: list[int] = []
+        self.borrow_shares: list[int] = []
+        self.collateral: list[int] = []
+
+    def copy(self) -> "_Columns":
+        columns = _Columns()
+        columns.index = self.index.copy()
+        columns.owners = self.owners.copy()
+        columns.supply_shares = self.supply_shares.copy()
+        columns.borrow_shares = self.borrow_shares.copy()
+        columns.collateral = self.collateral.copy()
+        return columns
+
+    def append(self, user: Address) -> int:
+        row = len(self.owners)
+        self.index[user] = row
+        self.owners.append(user)
+        self.supply_shares.append(0)
+        self.borrow_shares.append(0)
+        self.collateral.append(0)
+        return row
+
+    def pop(self, user: Address):
+        del self.index[user]
+        self.owners.pop()
+        self.supply_shares.pop()
+        self.borrow_shares.pop()
+        self.collateral.pop()
+
+
+class PositionView:
+    """A row of a `ColumnarPositionStore`, with the attributes of a `Position`."""
+
+    __slots__ = ("_columns", "_row")
+
+    def __init__(self, columns: _Columns, row: int):
+        self._columns = columns
+        self._row = row
+
+    @property
+    def supply_shares(self) -> int:
+        return self._columns.supply_shares[self._row]
+
+    @supply_shares.setter
+    def supply_shares(self, value: int):
+        self._columns.supply_shares[self._row] = value
+
+    @property
+    def borrow_shares(self) -> int:
+        return self._columns.borrow_shares[self._row]
+
+    @borrow_shares.setter
+    def borrow_shares(self, value: int):
+        self._columns.borrow_shares[self._row] = value
+
+    @property
+    def collateral(self) -> int:
+        return self._columns.collateral[self._row]
+
+    @collateral.setter
+    def collateral(self, value: int):
+        self._columns.collateral[self._row] = value
+
+    def __repr__(self) -> str:
+        return (
+            f"PositionView(supply_shares={self.supply_shares}, "
+            f"borrow_shares={self.borrow_shares}, collateral={self.collateral})"
+        )
+
+
+class ColumnarPositionStore(Layered):
+    """
+    Struct-of-arrays storage for `MorphoBlue._position`.
+
+    Indexing it with `(id, user)` like the default storage returns a
+    `PositionView` whose attributes read and write the columns of the market,
+    so the contract code is unchanged. `arrays(id)` exposes the columns of a
+    market as numpy object arrays, which keep exact integer semantics and let
+    the share math libraries run over a whole market at once.
+
+    Forks copy the columns of a market the first time they access it, and
+    transactions journal the rows they touch.
+    """
+
+    __slots__ = ("_markets", "_owned", "_undo")
+
+    def __init__(
+        self,
+        markets: dict[bytes, _Columns] = None,
+        owned: set[bytes] = None,
+        undo: dict[Tuple[bytes, Address], Optional[Tuple[int, int, int]]] = None,
+    ):
+        self._markets: dict[bytes, _Columns] = {} if markets is None else markets
+        # markets whose columns aren't shared with another branch
+        self._owned: set[bytes] = set(self._markets) if owned is None else owned
+        # journal of the rows touched by the open transaction
+        self._undo = undo
+
+    def _columns(self, id: bytes) -> _Columns:
+        columns = self._markets.get(id)
+        if columns is None:
+            columns = self._markets[id] = _Columns()
+            self._owned.add(id)
+        elif id not in self._owned:
+            columns = self._markets[id] = columns.copy()
+            self._owned.add(id)
+        return columns
+
+    def __getitem__(self, key: Tuple[bytes, Address]) -> PositionView:
+        id, user = key
+        columns = self._columns(id)
+        row = columns.index.get(user)
+        if row is None:
+            if self._undo is not None and key not in self._undo:
+                self._undo[key] = None
+            row = columns.append(user)
+        elif self._undo is not None and key not in self._undo:
+            self._undo[key] = (
+                columns.supply_shares[row],
+                columns.borrow_shares[row],
+                columns.collateral[row],
+            )
+        return PositionView(columns, row)
+
+    def read(self, key: Tuple[bytes, Address]):
+        """
+        The position at `key` without adding a row for a new user nor copying
+        shared columns. The position must not be modified.
+        """
+        id, user = key
+        columns = self._markets.get(id)
+        row = None if columns is None else columns.index.get(user)
+        if row is None:
+            return Position()
+        return PositionView(columns, row)
+
+    def __contains__(self, key: Tuple[bytes, Address]) -> bool:
+        id, user = key
+        columns = self._markets.get(id)
+        return columns is not None and user in columns.index
+
+    def __len__(self) -> int:
+        return sum(len(columns.owners) for columns in self._markets.values())
+
+    def market_ids(self) -> list[bytes]:
+        return list(self._markets)
+
+    def arrays(self, id: bytes) -> Tuple[list[Address], np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the owners of the positions of market `id` along with their
+        supply shares, borrow shares and collateral as object arrays.
+        """
+        columns = self._markets.get(id)
+        if columns is None:
+            empty = np.zeros(0, dtype=object)
+            return [], empty, empty.copy(), empty.copy()
+        return (
+            list(columns.owners),
+            np.array(columns.supply_shares, dtype=object),
+            np.array(columns.borrow_shares, dtype=object),
+            np.array(columns.collateral, dtype=object),
+        )
+
+    def child(self) -> "ColumnarPositionStore":
+        return ColumnarPositionStore(dict(self._markets), set())
+
+    def sibling(self) -> "ColumnarPositionStore":
+        return ColumnarPositionStore(dict(self._markets), set())
+
+    def layer(self) -> "ColumnarPositionStore":
+        # writes go straight to the shared columns, the undo log reverts them
+        return ColumnarPositionStore(self._markets, self._owned, {})
+
+    def merge(self, layer: "ColumnarPositionStore"):
+        if self._undo is not None:
+            for key, saved in layer._undo.items():
+                self._undo.setdefault(key, saved)
+
+    def discard(self, layer: "ColumnarPositionStore"):
+        for (id, user), saved in reversed(layer._undo.items()):
+            columns = self._columns(id)
+            if saved is None:
+                columns.pop(user)
+            else:
+                row = columns.index[user]
+                (
+                    columns.supply_shares[row],
+                    columns.borrow_shares[row],
+                    columns.collateral[row],
+                ) = saved
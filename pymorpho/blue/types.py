@@ -1,30 +1,58 @@
 from dataclasses import dataclass
+from typing import Any, ClassVar
 from pymorpho.utils.Mixer import Mixer, Address, ChainID, Metadata, InstanceType
 
 
-@dataclass
+def _encode_address(address: Address) -> bytes:
+    return bytes(12) + bytes.fromhex(str(address)[2:])
+
+
+@dataclass(frozen=True, eq=False)
 class MarketParams:
     loan_token: Address = Mixer.ZERO_ADDRESS
     collateral_token: Address = Mixer.ZERO_ADDRESS
     oracle: Address = Mixer.ZERO_ADDRESS
     irm: Address = Mixer.ZERO_ADDRESS
     lltv: int = 0
-    
+
     def __hash__(self) -> int:
-        return hash(self.id)
+        return hash(self.id())
 
-    def id(self) -> str:
-        return f"{self.loan_token}-{self.collateral_token}-{self.lltv}-{self.oracle}-{self.irm}"
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, MarketParams):
+            return NotImplemented
+        return self.id() == other.id()
 
+    def id(self) -> bytes:
+        """
+        keccak256 of the ABI-encoded params, as computed by MarketParamsLib.id
+        on chain. Computed on first use and cached on the instance.
+        """
+        try:
+            return self.__dict__["_id"]
+        except KeyError:
+            pass
+        from eth_hash.auto import keccak
 
-@dataclass
+        id = keccak(
+            _encode_address(self.loan_token)
+            + _encode_address(self.collateral_token)
+            + _encode_address(self.oracle)
+            + _encode_address(self.irm)
+            + self.lltv.to_bytes(32, "big")
+        )
+        self.__dict__["_id"] = id
+        return id
+
+
+@dataclass(slots=True)
 class Position:
     supply_shares: int = 0
     borrow_shares: int = 0
     collateral: int = 0
 
 
-@dataclass
+@dataclass(slots=True)
 class Market:
     total_supply_assets: int = 0
     total_supply_shares: int = 0
@@ -34,6 +62,42 @@ class Market:
     fee: int = 0
 
 
+@dataclass
+class UnhealthyPosition:
+    borrower: Address = Mixer.ZERO_ADDRESS
+    borrow_shares: int = 0
+    collateral: int = 0
+    # largest liquidation of the position: collateral seized for the repaid debt
+    seizable_collateral: int = 0
+    repaid_assets: int = 0
+    # largest `repaid_shares` accepted by `liquidate`, which on a position
+    # whose collateral caps the liquidation can seize slightly less than
+    # `seizable_collateral` because of the roundings of shares
+    repaid_shares: int = 0
+
+
+@dataclass
+class Action:
+    """A call to one of the market entry points of MorphoBlue, for `multicall`."""
+
+    FUNCTIONS: ClassVar[frozenset] = frozenset(
+        (
+            "supply",
+            "withdraw",
+            "borrow",
+            "repay",
+            "supply_collateral",
+            "withdraw_collateral",
+            "liquidate",
+            "accrue_interest",
+        )
+    )
+
+    function: str = ""
+    # positional arguments of the call, starting with the market params
+    args: tuple[Any, ...] = ()
+
+
 @dataclass
 class Authorization:
     authorizer: Address = Mixer.ZERO_ADDRESS
@@ -0,0 +1,185 @@
+from __future__ import annotations
+from pymorpho.blue.libraries.math_lib import WAD
+from pymorpho.blue.types import MarketParams
+from dataclasses import dataclass
+from pymorpho.utils.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+
+@dataclass
+class AllocatorMarket:
+    """
+    What the allocator needs to know about one market of a vault: the vault's
+    supply in it, the range that supply can be reallocated within and the
+    state and rate curve of the market.
+    """
+
+    market_params: MarketParams = MarketParams()
+    # supply of the vault and the bounds it can be moved to
+    supply_assets: int = 0
+    min_assets: int = 0
+    max_assets: int = 0
+    total_supply_assets: int = 0
+    total_borrow_assets: int = 0
+    fee: int = 0
+    # borrow rate at the target utilization, per second and scaled by WAD
+    rate_at_target: int = 0
+    # shape of the curve, a steepness of WAD makes the rate flat
+    curve_steepness: int = WAD
+    target_utilization: int = 9 * 10**17
+
+
+class Allocator:
+    """
+    Allocation of a vault's supply across its markets that maximizes the
+    interest it earns, given the current borrows and rate curves.
+
+    The interest earned in a market is concave in the vault's supply there:
+    each asset added dilutes the share of the vault and lowers the rate, so
+    the optimum equalizes the marginal interest of every market whose
+    allocation isn't at a bound. On each side of the target utilization the
+    curve is linear in the utilization, so the supply at which a market's
+    marginal interest equals a given rate is the root of a cubic, solved in
+    closed form for all the markets at once. The solver bisects on that rate
+    until the supplies add up to the assets of the vault, which takes a few
+    milliseconds for a full queue of 30 markets.
+    """
+
+    # bisection steps on the marginal rate
+    STEPS = 64
+    # moves below this fraction of the vault's assets aren't worth making
+    TOLERANCE = 1e-9
+
+    @staticmethod
+    def solve(markets: list[AllocatorMarket]) -> np.ndarray:
+        """Optimal supply of the vault in each market, as floats."""
+        if not markets:
+            return np.zeros(0)
+        field = lambda name: np.array(
+            [float(getattr(market, name)) for market in markets]
+        )
+        supply = field("supply_assets")
+        low, high = field("min_assets"), field("max_assets")
+        others = np.maximum(field("total_supply_assets") - supply, 0.0)
+        borrow = field("total_borrow_assets")
+        scale = (1.0 - field("fee") / WAD) * field("rate_at_target") / WAD * borrow
+        steepness = field("curve_steepness") / WAD
+        target = field("target_utilization") / WAD
+
+        # the total supply of each market ranges over [first, last] and the
+        # curve changes side at kink, past which the market is under target
+        first = np.maximum(others + low, np.maximum(borrow, 1.0))
+        last = np.maximum(others + high, first)
+        kink = np.clip(borrow / target, first, last)
+        # with a total supply of d, the marginal interest on a side of the
+        # curve is scale * (alpha * d + beta) / d**3
+        sides = []
+        for norm, coeff in (
+            (1.0 - target, steepness - 1.0),
+            (target, 1.0 - 1.0 / steepness),
+        ):
+            alpha = others * (1.0 - coeff * target / norm) - coeff * borrow / norm
+            beta = 2.0 * coeff * others * borrow / norm
+            sides.append((alpha, beta))
+        (above_alpha, above_beta), (below_alpha, below_beta) = sides
+
+        def marginal(d: np.ndarray, alpha: np.ndarray, beta: np.ndarray) -> np.ndarray:
+            return scale * (alpha * d + beta) / (d * d * d)
+
+        # markets entirely over the target have no side under it
+        at_kink = np.where(
+            kink < last, marginal(kink, below_alpha, below_beta), -np.inf
+        )
+        at_first = np.where(
+            first < kink,
+            marginal(first, above_alpha, above_beta),
+            marginal(first, below_alpha, below_beta),
+        )
+        at_last = np.where(
+            last > kink,
+            marginal(last, below_alpha, below_beta),
+            marginal(last, above_alpha, above_beta),
+        )
+
+        def supplies(rate: float) -> np.ndarray:
+            # total supply at which the marginal interest of each market is rate
+            above = rate >= at_kink
+            alpha = np.where(above, above_alpha, below_alpha)
+            beta = np.where(above, above_beta, below_beta)
+            lower = np.where(above, first, kink)
+            upper = np.where(above, kink, last)
+            if rate == 0.0:
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    d = -beta / alpha
+            else:
+                d = Allocator._cubic_root(
+                    -scale * alpha / rate, -scale * beta / rate, lower, upper
+                )
+            d = np.where(rate > at_first, first, np.where(rate < at_last, last, d))
+            # markets without interest only take what the others can't
+            d = np.where(scale > 0.0, d, first if rate > 0.0 else last)
+            return np.clip(np.nan_to_num(d, nan=0.0), first, last) - others
+
+        total_assets = supply.sum()
+        lowest, highest = min(at_last.min(), 0.0), max(at_first.max(), 0.0)
+        for _ in range(Allocator.STEPS):
+            middle = (lowest + highest) / 2
+            if supplies(middle).sum() > total_assets:
+                lowest = middle
+            else:
+                highest = middle
+        allocation = np.clip(supplies(highest), low, high)
+
+        # spread what the bisection left over on the markets with room
+        remainder = total_assets - allocation.sum()
+        room = high - allocation
+        if remainder > 0 and room.sum() > 0:
+            allocation += room * min(remainder / room.sum(), 1.0)
+        return allocation
+
+    @staticmethod
+    def _cubic_root(
+        p: np.ndarray, q: np.ndarray, lower: np.ndarray, upper: np.ndarray
+    ) -> np.ndarray:
+        """Real root of d**3 + p * d + q closest to [lower, upper]."""
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            scale = np.sqrt(np.abs(p) / 3.0)
+            ratio = 3.0 * q / (2.0 * p * scale)
+            # three real roots when p < 0 and |ratio| <= 1
+            angle = np.arccos(np.clip(ratio, -1.0, 1.0)) / 3.0
+            roots = [
+                2.0 * scale * np.cos(angle - 2.0 * np.pi * k / 3.0) for k in range(3)
+            ]
+            single = np.where(
+                p < 0.0,
+                -2.0 * np.sign(q) * scale * np.cosh(np.arccosh(np.abs(ratio)) / 3.0),
+                -2.0 * scale * np.sinh(np.arcsinh(ratio) / 3.0),
+            )
+            single = np.where(p == 0.0, np.cbrt(-q), single)
+            three = (p < 0.0) & (np.abs(ratio) <= 1.0)
+            candidates = np.stack(
+                [np.where(three, root, single) for root in roots]
+            )
+        distance = np.maximum(np.maximum(lower - candidates, candidates - upper), 0.0)
+        distance = np.nan_to_num(distance, nan=np.inf)
+        return np.take_along_axis(candidates, distance.argmin(axis=0)[None], 0)[0]
+
+    @staticmethod
+    def interest(markets: list[AllocatorMarket], allocation: np.ndarray) -> float:
+        """Interest per second earned by the vault with `allocation`, scaled by WAD."""
+        earned = 0.0
+        for market, x in zip(markets, allocation):
+            total = market.total_supply_assets - market.supply_assets + x
+            if total <= 0 or market.total_borrow_assets == 0:
+                continue
+            utilization = min(market.total_borrow_assets / total, 1.0)
+            target = market.target_utilization / WAD
+            steepness = market.curve_steepness / WAD
+            if utilization > target:
+                curve = 1.0 + (steepness - 1.0) * (utilization - target) / (1.0 - target)
+            else:
+                curve = 1.0 + (1.0 - 1.0 / steepness) * (utilization - target) / target
+            rate = market.rate_at_target * curve
+            earned += x * utilization * rate * (1.0 - market.fee / WAD)
+        return earned
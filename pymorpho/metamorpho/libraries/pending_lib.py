@@ -1,31 +1,41 @@
-from pymorpho.utils.Mixer import Mixer, Metadata, Address, ChainID, InstanceType
+from pymorpho.utils.Mixer import Mixer, Metadata, Address, ChainID, InstanceType, World
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True)
 class MarketConfig:
     cap: int = 0
     enabled: bool = False
     removable_at: int = 0
 
 
-@dataclass
+@dataclass(slots=True)
 class PendingUint192:
     value: int = 0
     valid_at: int = 0
-    chain: ChainID = ChainID.ETH_MAINNET
 
-    def update(self, new_value: int, timelock: int):
+    def update(
+        self,
+        new_value: int,
+        timelock: int,
+        world: World = Mixer.world,
+        chain: ChainID = ChainID.ETH_MAINNET,
+    ):
         self.value = new_value
-        self.valid_at = Mixer.block_timestamp(self.chain) + timelock
+        self.valid_at = world.block_timestamp(chain) + timelock
 
 
-@dataclass
+@dataclass(slots=True)
 class PendingAddress:
     value: Address = Mixer.ZERO_ADDRESS
     valid_at: int = 0
-    chain: ChainID = ChainID.ETH_MAINNET
 
-    def update(self, new_value: Address, timelock: int):
+    def update(
+        self,
+        new_value: Address,
+        timelock: int,
+        world: World = Mixer.world,
+        chain: ChainID = ChainID.ETH_MAINNET,
+    ):
         self.value = new_value
-        self.valid_at = Mixer.block_timestamp(self.chain) + timelock
+        self.valid_at = world.block_timestamp(chain) + timelock
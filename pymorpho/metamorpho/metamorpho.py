@@ -1,21 +1,25 @@
-from pymorpho.utils.Mixer import Mixer, Metadata, Address, ChainID, InstanceType
+from pymorpho.utils.Mixer import Mixer, Metadata, Address, ChainID, InstanceType, World
 from pymorpho.metamorpho.types import (
     MarketConfig,
     PendingUint192,
     PendingAddress,
     MarketAllocation,
     MarketParams,
+    LiquiditySnapshot,
 )
 from pymorpho.blue.types import Market
 from pymorpho.metamorpho.libraries.constants_lib import ConstantsLib
 from pymorpho.metamorpho.libraries.errors_lib import ErrorsLib
+from pymorpho.metamorpho.allocator import Allocator, AllocatorMarket
 from pymorpho.blue.libraries.shares_math_lib import SharesMathLib
 from pymorpho.blue.libraries.utils_lib import UtilsLib
 from pymorpho.blue.libraries.math_lib import WAD
 from pymorpho.openzeppelin.utils.math.math import Math as OZMath
 from pymorpho.openzeppelin.erc4626 import ERC4626
-from collections import defaultdict
+from pymorpho.utils.storage import Memo, Storage
+from dataclasses import replace
 from typing import Tuple
+import math
 
 
 class MetaMorpho(ERC4626):
@@ -34,15 +38,17 @@ class MetaMorpho(ERC4626):
             InstanceType.CONTRACT,
         ),
         sender=Mixer.ZERO_ADDRESS,
+        world: World = Mixer.world,
+        auto_accept: bool = False,
     ):
         self._MORPHO: Address = Mixer.ZERO_ADDRESS
         self._curator: Address = Mixer.ZERO_ADDRESS
-        self._is_allocator: defaultdict[Address, bool] = defaultdict(bool)
+        self._is_allocator: Storage[Address, bool] = Storage(bool)
         self._guardian: Address = Mixer.ZERO_ADDRESS
-        self._config: defaultdict[bytes, MarketConfig] = defaultdict(MarketConfig)
+        self._config: Storage[bytes, MarketConfig] = Storage(MarketConfig)
         self._timelock: int = 0
         self._pending_guardian: PendingAddress = PendingAddress()
-        self._pending_cap: defaultdict[bytes, PendingUint192] = defaultdict(
+        self._pending_cap: Storage[bytes, PendingUint192] = Storage(
             PendingUint192
         )
         self._pending_timelock: PendingUint192 = PendingUint192()
@@ -52,8 +58,13 @@ class MetaMorpho(ERC4626):
         self._supply_queue: list[bytes] = []
         self._withdraw_queue: list[bytes] = []
         self._last_total_assets = 0
+        # expected supply of the vault in each market, keyed by the block
+        # timestamp and the version of the market they were computed at
+        self._supply_assets: Memo = Memo()
+        # liquidity of the withdraw queue at the current block
+        self._liquidity: Memo = Memo()
 
-        ERC4626.__init__(self, asset, _name, _symbol, metadata, sender)
+        ERC4626.__init__(self, asset, _name, _symbol, metadata, sender, world)
         self._owner = owner
 
         assert morpho != Mixer.ZERO_ADDRESS, ErrorsLib.ZeroAddress
@@ -62,16 +73,20 @@ class MetaMorpho(ERC4626):
         self._set_timelock(initial_timelock)
 
         # Mixer utilities
-        self.metadata = metadata
+        self.metadata = replace(metadata)
+        self.world = world
+        # whether pending values and market removals are carried out by the
+        # scheduler of the world as soon as their timelock elapses
+        self.auto_accept = auto_accept
     
 
     def deploy(self) -> Address:
-        self.metadata.address = Mixer.register(self)
+        self.metadata.address = self.world.register(self)
 
         # TODO: this feels very hacky, there's probably a better way 
         # and more general way of doing it, like implementing a _post_deployment(self) function for all smart contracts that require
         # something to be done with the address
-        Mixer.contracts_and_eoas[self._asset].force_approve(
+        self.world.contracts_and_eoas[self._asset].force_approve(
             self._MORPHO, 2**256 - 1, self.metadata.address
         )
         return self.metadata.address
@@ -85,7 +100,7 @@ class MetaMorpho(ERC4626):
 
     def _only_allocator_role(self, sender):
         assert (
-            self._is_allocator[sender] or sender == self._owner
+            self._is_allocator.read(sender) or sender == self._owner
         ), ErrorsLib.NotAllocatorRole
 
     def _only_guardian_role(self, sender):
@@ -101,7 +116,7 @@ class MetaMorpho(ERC4626):
     def _after_timelock(self, valid_at):
         assert valid_at != 0, ErrorsLib.NoPendingValue
         assert (
-            Mixer.block_timestamp(self.metadata.chain) >= valid_at
+            self.world.block_timestamp(self.metadata.chain) >= valid_at
         ), ErrorsLib.TimelockNotElapsed
 
     def set_curator(self, new_curator: Address, sender=Mixer.ZERO_ADDRESS):
@@ -115,7 +130,7 @@ class MetaMorpho(ERC4626):
     ):
         self._only_owner(sender)
         assert not (
-            self._is_allocator[new_allocator] == new_is_allocator
+            self._is_allocator.read(new_allocator) == new_is_allocator
         ), ErrorsLib.AlreadySet
         self._is_allocator[new_allocator] = new_is_allocator
         # TODO: emit event ?
@@ -138,7 +153,10 @@ class MetaMorpho(ERC4626):
             assert not (
                 new_timelock == self._pending_timelock.value
             ), ErrorsLib.AlreadyPending
-            self._pending_timelock.update(new_timelock, self._timelock)
+            self._pending_timelock.update(
+                new_timelock, self._timelock, self.world, self.metadata.chain
+            )
+            self._schedule_pending("accept_timelock", self._pending_timelock.valid_at)
 
         # TODO: emit event ?
 
@@ -161,7 +179,7 @@ class MetaMorpho(ERC4626):
         assert not (
             new_fee_recipient == Mixer.ZERO_ADDRESS and self._fee != 0
         ), ErrorsLib.ZeroFeeRecipient
-        self._update_total_assets(self._accrue_fee())
+        self._update_last_total_assets(self._accrue_fee())
         self._fee_recipient = new_fee_recipient
         # TODO: emit event ?
 
@@ -174,7 +192,10 @@ class MetaMorpho(ERC4626):
                 self._pending_guardian.valid_at != 0
                 and new_guardian == self._pending_guardian.value
             ), ErrorsLib.AlreadyPending
-            self._pending_guardian.update(new_guardian, self._timelock)
+            self._pending_guardian.update(
+                new_guardian, self._timelock, self.world, self.metadata.chain
+            )
+            self._schedule_pending("accept_guardian", self._pending_guardian.valid_at)
             # TODO: emit event ?
 
     def submit_cap(
@@ -189,30 +210,41 @@ class MetaMorpho(ERC4626):
             market_params.loan_token != self.asset()
         ), ErrorsLib.InconsistentAsset(id)
         assert not (
-            Mixer.contracts_and_eoas[self._MORPHO].last_update(id, self.metadata.address)
+            self.world.contracts_and_eoas[self._MORPHO].last_update(id, self.metadata.address)
             == 0
         ), ErrorsLib.MarketNotCreated
 
-        supply_cap = self._config[id].cap
+        supply_cap = self._config.read(id).cap
         assert not (new_supply_cap == supply_cap), ErrorsLib.AlreadySet
 
         if new_supply_cap < supply_cap:
             self._set_cap(id, new_supply_cap)
         else:
             assert not (
-                new_supply_cap == self._pending_cap[id].value
+                new_supply_cap == self._pending_cap.read(id).value
             ), ErrorsLib.AlreadyPending
-            self._pending_cap[id].update(new_supply_cap, self._timelock)
+            self._pending_cap[id].update(
+                new_supply_cap, self._timelock, self.world, self.metadata.chain
+            )
+            self._schedule_pending("accept_cap", self._pending_cap[id].valid_at, id)
             # TODO: emit event ?
 
     def submit_market_removal(self, id: bytes, sender=Mixer.ZERO_ADDRESS):
         self._only_curator_role(sender)
-        assert not (self._config[id].removable_at != 0), ErrorsLib.AlreadySet
-        assert self._config[id].enabled, ErrorsLib.MarketNotCreated
+        assert not (self._config.read(id).removable_at != 0), ErrorsLib.AlreadySet
+        assert self._config.read(id).enabled, ErrorsLib.MarketNotCreated
         self._set_cap(id, 0)
         self._config[id].removable_at = (
-            Mixer.block_timestamp(self.metadata.chain) + self._timelock
+            self.world.block_timestamp(self.metadata.chain) + self._timelock
         )
+        if self.auto_accept:
+            self.world.schedule(
+                self._config[id].removable_at,
+                self.metadata.address,
+                "_remove_market_if_due",
+                id,
+                self._config[id].removable_at,
+            )
         # TODO: emit event ?
 
     def set_supply_queue(
@@ -225,7 +257,7 @@ class MetaMorpho(ERC4626):
         ), ErrorsLib.MaxQueueLengthExceeded
         for i in range(length):
             assert not (
-                self._config[new_supply_queue[i]].cap == 0
+                self._config.read(new_supply_queue[i]).cap == 0
             ), ErrorsLib.MarketNotCreated
         self._supply_queue = new_supply_queue
         # TODO: emit event ?
@@ -239,7 +271,7 @@ class MetaMorpho(ERC4626):
         new_withdraw_queue = [0] * new_length
         for i in range(new_length):
             prev_index = indexes[i]
-            id = self._withdraw_queue[i]
+            id = self._withdraw_queue[prev_index]
             assert not (seen[prev_index]), ErrorsLib.DuplicateMarket(id)
             seen[prev_index] = True
             new_withdraw_queue[i] = id
@@ -248,21 +280,21 @@ class MetaMorpho(ERC4626):
             if not (seen[i]):
                 id = self._withdraw_queue[i]
                 assert not (
-                    self._config[id].cap != 0
+                    self._config.read(id).cap != 0
                 ), ErrorsLib.InvalidMarketRemovalNonZeroCap(id)
 
                 if (
-                    Mixer.contracts_and_eoas[self._MORPHO].supply_shares(
+                    self.world.contracts_and_eoas[self._MORPHO].supply_shares(
                         id, self.metadata.address
                     )
                     != 0
                 ):
                     assert not (
-                        self._config[id].removable_at == 0
+                        self._config.read(id).removable_at == 0
                     ), ErrorsLib.InvalidMarketRemovalNonZeroSupply(id)
                     assert not (
-                        Mixer.block_timestamp(self.metadata.chain)
-                        < self._config[id].removable_at
+                        self.world.block_timestamp(self.metadata.chain)
+                        < self._config.read(id).removable_at
                     ), ErrorsLib.InvalidMarketRemovalTimelockNotElapsed(id)
                 self._config[id] = MarketConfig()
         self._withdraw_queue = new_withdraw_queue
@@ -290,7 +322,7 @@ class MetaMorpho(ERC4626):
                 if allocation.assets == 0:
                     shares = supply_shares
                     withdrawn = 0
-                withdrawn_assets, withdrawn_shares = Mixer.contracts_and_eoas[
+                withdrawn_assets, withdrawn_shares = self.world.contracts_and_eoas[
                     self._MORPHO
                 ].withdraw(
                     allocation.market_params,
@@ -309,12 +341,12 @@ class MetaMorpho(ERC4626):
                 )
                 if supplied_assets == 0:
                     continue
-                supply_cap = self._config[id].cap
+                supply_cap = self._config.read(id).cap
                 assert not (supply_cap == 0), ErrorsLib.UnauthorizedMarket(id)
                 assert not (
                     supply_assets + supplied_assets > supply_cap
                 ), ErrorsLib.SupplyCapExceeded(id)
-                _, supplied_shares = Mixer.contracts_and_eoas[self._MORPHO].supply(
+                _, supplied_shares = self.world.contracts_and_eoas[self._MORPHO].supply(
                     allocation.market_params,
                     supplied_assets,
                     0,
@@ -327,6 +359,90 @@ class MetaMorpho(ERC4626):
             total_supplied != total_withdrawn
         ), ErrorsLib.InconsistentReallocation
 
+    def optimal_reallocation(
+        self, sender=Mixer.ZERO_ADDRESS
+    ) -> list[MarketAllocation]:
+        """
+        Allocations to pass to `reallocate` to move the supply of the vault to
+        the allocation of its withdraw queue earning the most interest, within
+        the caps and the liquidity of each market. See `Allocator`. IRMs with a
+        `rate_curve_view`, like the AdaptiveCurveIRM, are modelled by the curve
+        it returns, any other by a flat rate.
+        """
+        morpho = self.world.contracts_and_eoas[self._MORPHO]
+        markets: list[AllocatorMarket] = []
+        for id in self._withdraw_queue:
+            market_params = self._market_params(id)
+            total_supply_assets, _, total_borrow_assets, _ = (
+                morpho.expected_market_balances(market_params)
+            )
+            supply_assets = morpho.expected_supply_assets(
+                market_params, self.metadata.address
+            )
+            cap = self._config.read(id).cap
+            irm = self.world.contracts_and_eoas[market_params.irm]
+            market = morpho.market(id)
+            rate_curve_view = getattr(irm, "rate_curve_view", None)
+            if rate_curve_view is not None:
+                rate_at_target, curve_steepness, target_utilization = (
+                    rate_curve_view(market_params, market)
+                )
+                curve = dict(
+                    rate_at_target=rate_at_target,
+                    curve_steepness=curve_steepness,
+                    target_utilization=target_utilization,
+                )
+            else:
+                # any other irm is taken as flat around its current rate
+                curve = dict(rate_at_target=irm.borrow_rate_view(market_params, market))
+            markets.append(
+                AllocatorMarket(
+                    market_params=market_params,
+                    supply_assets=supply_assets,
+                    min_assets=supply_assets
+                    - self._withdrawable(
+                        market_params,
+                        total_supply_assets,
+                        total_borrow_assets,
+                        supply_assets,
+                    ),
+                    max_assets=supply_assets if cap == 0 else max(supply_assets, cap),
+                    total_supply_assets=total_supply_assets,
+                    total_borrow_assets=total_borrow_assets,
+                    fee=market.fee,
+                    **curve,
+                )
+            )
+        targets = Allocator.solve(markets)
+        # moves smaller than this are rounding noise of the solver
+        dust = Allocator.TOLERANCE * sum(market.supply_assets for market in markets)
+
+        # targets are rounded so that slightly less is withdrawn and supplied,
+        # the last supply then takes whatever was withdrawn and not supplied
+        withdrawals: list[MarketAllocation] = []
+        supplies: list[Tuple[int, MarketAllocation]] = []
+        for market, target in zip(markets, targets):
+            if abs(target - market.supply_assets) <= dust:
+                continue
+            if target < market.supply_assets:
+                assets = min(math.ceil(target), market.supply_assets)
+                if assets < market.supply_assets:
+                    withdrawals.append(MarketAllocation(market.market_params, assets))
+            elif target > market.supply_assets:
+                assets = math.floor(target)
+                if assets > market.supply_assets:
+                    supplies.append(
+                        (
+                            market.max_assets - assets,
+                            MarketAllocation(market.market_params, assets),
+                        )
+                    )
+        if not withdrawals or not supplies:
+            return []
+        supplies.sort(key=lambda supply: supply[0])
+        supplies[-1][1].assets = 2**256 - 1
+        return withdrawals + [allocation for _, allocation in supplies]
+
     def revoke_pending_timelock(self, sender=Mixer.ZERO_ADDRESS):
         self._only_guardian_role(sender)
         assert not (self._pending_timelock.valid_at == 0), ErrorsLib.NoPendingValue
@@ -342,7 +458,7 @@ class MetaMorpho(ERC4626):
 
     def revoke_pending_market_removal(self, id: bytes, sender=Mixer.ZERO_ADDRESS):
         self._only_curator_or_guardian_role(sender)
-        assert not (self._config[id].removable_at == 0), ErrorsLib.AlreadySet
+        assert not (self._config.read(id).removable_at == 0), ErrorsLib.AlreadySet
         self._config[id].removable_at = 0
 
     def supply_queue_length(self, sender=Mixer.ZERO_ADDRESS) -> int:
@@ -360,15 +476,55 @@ class MetaMorpho(ERC4626):
         self._set_guardian(self._pending_guardian.value)
 
     def accept_cap(self, id: bytes, sender=Mixer.ZERO_ADDRESS):
-        self._after_timelock(self._pending_cap[id].valid_at)
-        self._set_cap(id, self._pending_cap[id].value)
+        self._after_timelock(self._pending_cap.read(id).valid_at)
+        self._set_cap(id, self._pending_cap.read(id).value)
+
+    def _schedule_pending(self, function: str, valid_at: int, *args):
+        if self.auto_accept:
+            self.world.schedule(
+                valid_at,
+                self.metadata.address,
+                "_accept_if_due",
+                function,
+                valid_at,
+                *args,
+            )
+
+    def _accept_if_due(self, function: str, valid_at: int, *args):
+        """
+        Scheduled `accept_*` call, skipped if the value it was scheduled for
+        has since been accepted, revoked or submitted again.
+        """
+        if function == "accept_timelock":
+            pending = self._pending_timelock
+        elif function == "accept_guardian":
+            pending = self._pending_guardian
+        else:
+            pending = self._pending_cap.get(args[0])
+        if pending is not None and pending.valid_at == valid_at:
+            getattr(self, function)(*args)
+
+    def _remove_market_if_due(self, id: bytes, removable_at: int):
+        """
+        Scheduled removal of market `id` from the withdraw queue, skipped if
+        the removal has since been revoked or carried out.
+        """
+        config = self._config.get(id)
+        if config is None or config.removable_at != removable_at or config.cap != 0:
+            return
+        if id not in self._withdraw_queue:
+            return
+        self.update_withdraw_queue(
+            [i for i, other in enumerate(self._withdraw_queue) if other != id],
+            self._owner,
+        )
 
     def skim(self, token: Address, sender=Mixer.ZERO_ADDRESS):
         assert not (self._skim_recipient == Mixer.ZERO_ADDRESS), ErrorsLib.ZERO_ADDRESS
-        amount: int = Mixer.contracts_and_eoas[token].balance_of(
+        amount: int = self.world.contracts_and_eoas[token].balance_of(
             self.metadata.address, self.metadata.address
         )
-        Mixer.contracts_and_eoas[token].safe_transfer(
+        self.world.contracts_and_eoas[token].safe_transfer(
             self._skim_recipient, amount, self.metadata.address
         )
 
@@ -389,6 +545,26 @@ class MetaMorpho(ERC4626):
             assets, new_total_supply, new_total_assets, OZMath.Rounding.Floor
         )
 
+    def max_withdraw_many(
+        self, owners: list[Address], sender=Mixer.ZERO_ADDRESS
+    ) -> list[int]:
+        snapshot = self._liquidity_snapshot()
+        return [self._max_withdraw_from(snapshot, owner) for owner in owners]
+
+    def max_redeem_many(
+        self, owners: list[Address], sender=Mixer.ZERO_ADDRESS
+    ) -> list[int]:
+        snapshot = self._liquidity_snapshot()
+        return [
+            self._convert_to_shares_with_totals(
+                self._max_withdraw_from(snapshot, owner),
+                snapshot.new_total_supply,
+                snapshot.new_total_assets,
+                OZMath.Rounding.Floor,
+            )
+            for owner in owners
+        ]
+
     def deposit(self, assets: int, receiver: Address, sender=Mixer.ZERO_ADDRESS) -> int:
         new_total_assets = self._accrue_fee()
         self._last_total_assets = new_total_assets
@@ -433,39 +609,201 @@ class MetaMorpho(ERC4626):
         self._withdraw(sender, receiver, owner, assets, shares)
         return assets
 
+    def deposit_many(
+        self,
+        assets: list[int],
+        receivers: list[Address],
+        senders: list[Address],
+    ) -> list[int]:
+        """
+        Deposits `assets[i]` of `senders[i]` for `receivers[i]`, for every i,
+        and returns the shares minted to each receiver.
+
+        The deposits are first replayed one after the other on a copy of the
+        totals of the vault and of the markets of its supply queue, with the
+        exact rounding of `deposit`, so each receiver gets the shares it would
+        get from sequential deposits. The fee is then minted once and each
+        market receives the sum of its supplies in a single Morpho call, which
+        can leave the vault a few share units more than sequential supplies.
+        """
+        with self.world.transaction():
+            markets: dict[bytes, list[int]] = {}
+            total_supply = self.total_supply()
+            total_assets = self.total_assets()
+            last_total_assets = self._last_total_assets
+            fee_shares = 0
+            supplied: dict[bytes, int] = {}
+            minted = []
+            for amount in assets:
+                shares = self._fee_shares(
+                    total_assets, last_total_assets, total_supply
+                )
+                fee_shares += shares
+                total_supply += shares
+                last_total_assets = total_assets
+                shares = self._convert_to_shares_with_totals(
+                    amount, total_supply, total_assets, OZMath.Rounding.Floor
+                )
+                minted.append(shares)
+                total_supply += shares
+                total_assets += self._simulate_supply_morpho(
+                    markets, supplied, amount
+                )
+                last_total_assets += amount
+
+            if fee_shares != 0:
+                self._mint(self._fee_recipient, fee_shares)
+            for amount, shares, receiver, caller in zip(
+                assets, minted, receivers, senders
+            ):
+                ERC4626._deposit(self, caller, receiver, amount, shares)
+            morpho = self.world.contracts_and_eoas[self._MORPHO]
+            for id, amount in supplied.items():
+                morpho.supply(
+                    self._market_params(id),
+                    amount,
+                    0,
+                    self.metadata.address,
+                    None,
+                    self.metadata.address,
+                )
+            self._update_last_total_assets(last_total_assets)
+        return minted
+
+    def redeem_many(
+        self,
+        shares: list[int],
+        receivers: list[Address],
+        owners: list[Address],
+        senders: list[Address],
+    ) -> list[int]:
+        """
+        Redeems `shares[i]` of `owners[i]` on behalf of `senders[i]` to
+        `receivers[i]`, for every i, and returns the assets each receiver gets,
+        exactly as sequential redemptions would. Works like `deposit_many`,
+        each market being withdrawn from in a single Morpho call.
+        """
+        with self.world.transaction():
+            markets: dict[bytes, list[int]] = {}
+            total_supply = self.total_supply()
+            total_assets = self.total_assets()
+            last_total_assets = self._last_total_assets
+            fee_shares = 0
+            withdrawn: dict[bytes, int] = {}
+            redeemed = []
+            morpho_balance = [
+                self.world.contracts_and_eoas[self._asset].balance_of(self._MORPHO)
+            ]
+            for amount in shares:
+                minted = self._fee_shares(
+                    total_assets, last_total_assets, total_supply
+                )
+                fee_shares += minted
+                total_supply += minted
+                assets = self._convert_to_assets_with_totals(
+                    amount, total_supply, total_assets, OZMath.Rounding.Floor
+                )
+                redeemed.append(assets)
+                last_total_assets = UtilsLib.zero_floor_sub(total_assets, assets)
+                total_assets += self._simulate_withdraw_morpho_from(
+                    markets, withdrawn, morpho_balance, assets
+                )
+                total_supply -= amount
+
+            if fee_shares != 0:
+                self._mint(self._fee_recipient, fee_shares)
+            morpho = self.world.contracts_and_eoas[self._MORPHO]
+            for id, amount in withdrawn.items():
+                morpho.withdraw(
+                    self._market_params(id),
+                    amount,
+                    0,
+                    self.metadata.address,
+                    self.metadata.address,
+                    self.metadata.address,
+                )
+            for amount, assets, receiver, owner, caller in zip(
+                shares, redeemed, receivers, owners, senders
+            ):
+                ERC4626._withdraw(self, caller, receiver, owner, assets, amount)
+            self._update_last_total_assets(last_total_assets)
+        return redeemed
+
     def total_assets(self) -> int:
+        morpho = self.world.contracts_and_eoas[self._MORPHO]
+        timestamp = self.world.block_timestamp(self.metadata.chain)
         assets = 0
-        for i in range(len(self._withdraw_queue)):
-            assets += Mixer.contracts_and_eoas[self._MORPHO].expected_supply_assets(
-                self._market_params(self._withdraw_queue[i]), self.metadata.address
-            )
+        for id in self._withdraw_queue:
+            # the supply of the vault in a market only changes with time or
+            # through the entry points of Morpho, which bump its version
+            key = (timestamp, morpho.market_version(id), self.world.approximate_rates)
+            supply_assets = self._supply_assets.get(id, key)
+            if supply_assets is None:
+                supply_assets = morpho.expected_supply_assets(
+                    self._market_params(id), self.metadata.address
+                )
+                self._supply_assets.put(id, key, supply_assets)
+            assets += supply_assets
         return assets
 
     def _decimals_offset(self) -> int:
         return ConstantsLib.DECIMALS_OFFSET
 
     def _max_withdraw(self, owner: Address) -> Tuple[int, int, int]:
-        assets, new_total_supply, new_total_assets = 0, 0, 0
-        fee_shares = 0
-        fee_shares, new_total_assets = self._accrued_fee_shares()
-        new_total_supply = self.total_supply() + fee_shares
+        snapshot = self._liquidity_snapshot()
+        return (
+            self._max_withdraw_from(snapshot, owner),
+            snapshot.new_total_supply,
+            snapshot.new_total_assets,
+        )
+
+    def _max_withdraw_from(self, snapshot: LiquiditySnapshot, owner: Address) -> int:
         assets = self._convert_to_assets_with_totals(
             self.balance_of(owner),
-            new_total_supply,
-            new_total_assets,
+            snapshot.new_total_supply,
+            snapshot.new_total_assets,
             OZMath.Rounding.Floor,
         )
-        assets -= self._simulate_withdraw_morpho(assets)
-        return assets, new_total_supply, new_total_assets
+        return UtilsLib.min(assets, snapshot.liquidity())
+
+    def _liquidity_snapshot(self) -> LiquiditySnapshot:
+        """
+        Liquidity of the vault at the current block, shared by every max
+        withdraw and redeem quoted until the vault or one of its markets is
+        touched. Market versions are never reused, even after a revert, so a
+        snapshot taken in a reverted transaction can't be served again.
+        """
+        morpho = self.world.contracts_and_eoas[self._MORPHO]
+        key = (
+            self.world.block_timestamp(self.metadata.chain),
+            tuple((id, morpho.market_version(id)) for id in self._withdraw_queue),
+            self.world.approximate_rates,
+            self.world.contracts_and_eoas[self._asset].balance_of(self._MORPHO),
+            self.total_supply(),
+            self._last_total_assets,
+            self._fee,
+        )
+        snapshot = self._liquidity.get(None, key)
+        if snapshot is None:
+            fee_shares, new_total_assets = self._accrued_fee_shares()
+            withdrawable = self._withdrawable_queue()
+            snapshot = LiquiditySnapshot(
+                withdrawable,
+                sum(withdrawable),
+                self.total_supply() + fee_shares,
+                new_total_assets,
+            )
+            self._liquidity.put(None, key, snapshot)
+        return snapshot
 
     def _max_deposit(self) -> int:
         total_suppliable = 0
         for i in range(len(self._supply_queue)):
             id = self._supply_queue[i]
-            supply_cap = self._config[id].cap
+            supply_cap = self._config.read(id).cap
             if supply_cap == 0:
                 continue
-            supply_assets = Mixer.contracts_and_eoas[
+            supply_assets = self.world.contracts_and_eoas[
                 self._MORPHO
             ].expected_supply_assets(self._market_params(id), self.metadata.address)
             total_suppliable += UtilsLib.zero_floor_sub(supply_cap, supply_assets)
@@ -528,16 +866,16 @@ class MetaMorpho(ERC4626):
         super()._withdraw(caller, receiver, owner, assets, shares)
 
     def _market_params(self, id: bytes) -> MarketParams:
-        return Mixer.contracts_and_eoas[self._MORPHO].id_to_market_params(id)
+        return self.world.contracts_and_eoas[self._MORPHO].id_to_market_params(id)
 
     def _accrued_supply_balance(
         self, market_params: MarketParams, id: bytes
     ) -> Tuple[int, int, Market]:
-        Mixer.contracts_and_eoas[self._MORPHO].accrue_interest(
+        self.world.contracts_and_eoas[self._MORPHO].accrue_interest(
             market_params, self.metadata.address
         )
-        market = Mixer.contracts_and_eoas[self._MORPHO].market(id)
-        shares = Mixer.contracts_and_eoas[self._MORPHO].supply_shares(
+        market = self.world.contracts_and_eoas[self._MORPHO].market(id)
+        shares = self.world.contracts_and_eoas[self._MORPHO].supply_shares(
             id, self.metadata.address
         )
         assets = SharesMathLib.to_assets_down(
@@ -580,7 +918,7 @@ class MetaMorpho(ERC4626):
     def _supply_morpho(self, assets: int):
         for i in range(len(self._supply_queue)):
             id = self._supply_queue[i]
-            supply_cap = self._config[id].cap
+            supply_cap = self._config.read(id).cap
             if supply_cap == 0:
                 continue
             market_params = self._market_params(id)
@@ -589,7 +927,7 @@ class MetaMorpho(ERC4626):
                 UtilsLib.zero_floor_sub(supply_cap, supply_assets), assets
             )
             if to_supply > 0:
-                Mixer.contracts_and_eoas[self._MORPHO].supply(
+                self.world.contracts_and_eoas[self._MORPHO].supply(
                     market_params,
                     to_supply,
                     0,
@@ -608,7 +946,7 @@ class MetaMorpho(ERC4626):
             market_params = self._market_params(id)
             supply_assets, _, market = self._accrued_supply_balance(market_params, id)
             to_withdraw = UtilsLib.min(
-                self._withdrawble(
+                self._withdrawable(
                     market_params,
                     market.total_supply_assets,
                     market.total_borrow_assets,
@@ -617,7 +955,7 @@ class MetaMorpho(ERC4626):
                 assets,
             )
             if to_withdraw > 0:
-                Mixer.contracts_and_eoas[self._MORPHO].withdraw(
+                self.world.contracts_and_eoas[self._MORPHO].withdraw(
                     market_params,
                     to_withdraw,
                     0,
@@ -630,22 +968,128 @@ class MetaMorpho(ERC4626):
                 return
         assert not (assets != 0), ErrorsLib.NotEnoughLiquidity
 
+    def _simulated_market(self, markets: dict[bytes, list[int]], id: bytes) -> list[int]:
+        """
+        Totals of market `id` and the supply shares and assets of the vault in
+        it, accrued the first time the market is visited like
+        `_accrued_supply_balance` does.
+        """
+        market = markets.get(id)
+        if market is None:
+            _, supply_shares, state = self._accrued_supply_balance(
+                self._market_params(id), id
+            )
+            market = markets[id] = [
+                state.total_supply_assets,
+                state.total_supply_shares,
+                state.total_borrow_assets,
+                supply_shares,
+            ]
+        return market
+
+    def _simulate_supply_morpho(
+        self, markets: dict[bytes, list[int]], supplied: dict[bytes, int], assets: int
+    ) -> int:
+        """
+        Replays `_supply_morpho(assets)` on `markets`, adding the supplies to
+        `supplied`, and returns the change of the total assets of the vault.
+        """
+        change = 0
+        for id in self._supply_queue:
+            supply_cap = self._config.read(id).cap
+            if supply_cap == 0:
+                continue
+            market = self._simulated_market(markets, id)
+            total_supply_assets, total_supply_shares, _, supply_shares = market
+            supply_assets = SharesMathLib.to_assets_down(
+                supply_shares, total_supply_assets, total_supply_shares
+            )
+            to_supply = UtilsLib.min(
+                UtilsLib.zero_floor_sub(supply_cap, supply_assets), assets
+            )
+            if to_supply > 0:
+                shares = SharesMathLib.to_shares_down(
+                    to_supply, total_supply_assets, total_supply_shares
+                )
+                market[0] += to_supply
+                market[1] += shares
+                market[3] += shares
+                supplied[id] = supplied.get(id, 0) + to_supply
+                if id in self._withdraw_queue:
+                    change += (
+                        SharesMathLib.to_assets_down(market[3], market[0], market[1])
+                        - supply_assets
+                    )
+                assets -= to_supply
+            if assets == 0:
+                return change
+        assert not (assets != 0), ErrorsLib.AllCapsReached
+        return change
+
+    def _simulate_withdraw_morpho_from(
+        self,
+        markets: dict[bytes, list[int]],
+        withdrawn: dict[bytes, int],
+        morpho_balance: list[int],
+        assets: int,
+    ) -> int:
+        """
+        Replays `_withdraw_morpho(assets)` on `markets` and on the balance of
+        Morpho, adding the withdrawals to `withdrawn`, and returns the change
+        of the total assets of the vault.
+        """
+        change = 0
+        for id in self._withdraw_queue:
+            market = self._simulated_market(markets, id)
+            total_supply_assets, total_supply_shares, total_borrow_assets, supply_shares = market
+            supply_assets = SharesMathLib.to_assets_down(
+                supply_shares, total_supply_assets, total_supply_shares
+            )
+            to_withdraw = UtilsLib.min(
+                UtilsLib.min(
+                    supply_assets,
+                    UtilsLib.min(
+                        total_supply_assets - total_borrow_assets, morpho_balance[0]
+                    ),
+                ),
+                assets,
+            )
+            if to_withdraw > 0:
+                shares = SharesMathLib.to_shares_up(
+                    to_withdraw, total_supply_assets, total_supply_shares
+                )
+                market[0] -= to_withdraw
+                market[1] -= shares
+                market[3] -= shares
+                morpho_balance[0] -= to_withdraw
+                withdrawn[id] = withdrawn.get(id, 0) + to_withdraw
+                change += (
+                    SharesMathLib.to_assets_down(market[3], market[0], market[1])
+                    - supply_assets
+                )
+                assets -= to_withdraw
+            if assets == 0:
+                return change
+        assert not (assets != 0), ErrorsLib.NotEnoughLiquidity
+        return change
+
     def _simulate_withdraw_morpho(self, assets: int) -> int:
-        for i in range(len(self._withdraw_queue)):
-            id = self._withdraw_queue[i]
+        return UtilsLib.zero_floor_sub(assets, self._liquidity_snapshot().liquidity())
+
+    def _withdrawable_queue(self) -> list[int]:
+        """Assets withdrawable from each market of the withdraw queue."""
+        morpho = self.world.contracts_and_eoas[self._MORPHO]
+        withdrawable = []
+        for id in self._withdraw_queue:
             market_params = self._market_params(id)
-            supply_shares = Mixer.contracts_and_eoas[self._MORPHO].supply_shares(
-                id, self.metadata.address
-            )
+            supply_shares = morpho.supply_shares(id, self.metadata.address)
             (
                 total_supply_assets,
                 total_supply_shares,
                 total_borrow_assets,
                 _,
-            ) = Mixer.contracts[self._MORPHO].expected_market_balances(market_params)
-
-            assets = UtilsLib.zero_floor_sub(
-                assets,
+            ) = morpho.expected_market_balances(market_params)
+            withdrawable.append(
                 self._withdrawable(
                     market_params,
                     total_supply_assets,
@@ -653,11 +1097,9 @@ class MetaMorpho(ERC4626):
                     SharesMathLib.to_assets_down(
                         supply_shares, total_supply_assets, total_supply_shares
                     ),
-                ),
+                )
             )
-            if assets == 0:
-                break
-        return assets
+        return withdrawable
 
     def _withdrawable(
         self,
@@ -668,12 +1110,12 @@ class MetaMorpho(ERC4626):
     ) -> int:
         available_liquidity = UtilsLib.min(
             total_supply_assets - total_borrow_assets,
-            Mixer.contracts_and_eoas[market_params.loan_token].balance_of(self._MORPHO),
+            self.world.contracts_and_eoas[market_params.loan_token].balance_of(self._MORPHO),
         )
         return UtilsLib.min(supply_assets, available_liquidity)
 
     def _update_last_total_assets(self, updated_total_assets: int):
-        last_total_assets = updated_total_assets
+        self._last_total_assets = updated_total_assets
         # TODO: emit event ?
 
     def _accrue_fee(self) -> int:
@@ -689,18 +1131,24 @@ class MetaMorpho(ERC4626):
         new_total_assets = 0
 
         new_total_assets = self.total_assets()
-        total_interest = UtilsLib.zero_floor_sub(
-            new_total_assets, self._last_total_assets
+        fee_shares = self._fee_shares(
+            new_total_assets, self._last_total_assets, self.total_supply()
         )
+        return fee_shares, new_total_assets
+
+    def _fee_shares(
+        self, new_total_assets: int, last_total_assets: int, total_supply: int
+    ) -> int:
+        total_interest = UtilsLib.zero_floor_sub(new_total_assets, last_total_assets)
         if total_interest != 0 and self._fee != 0:
             fee_assets = OZMath.mul_div(total_interest, self._fee, WAD)
-            fee_shares = self._convert_to_shares_with_totals(
+            return self._convert_to_shares_with_totals(
                 fee_assets,
-                self.total_supply(),
+                total_supply,
                 new_total_assets - fee_assets,
                 OZMath.Rounding.Floor,
             )
-        return fee_shares, new_total_assets
+        return 0
 
     def MORPHO(self, sender = Mixer.ZERO_ADDRESS) -> Address:
         return self._MORPHO
@@ -709,7 +1157,13 @@ class MetaMorpho(ERC4626):
         return self._curator
     
     def is_allocator(self, account: Address, sender = Mixer.ZERO_ADDRESS) -> bool:
-        return self._is_allocator[account]
+        return self._is_allocator.read(account)
+
+    def config(self, id: bytes, sender = Mixer.ZERO_ADDRESS) -> MarketConfig:
+        return self._config.read(id)
+
+    def pending_cap(self, id: bytes, sender = Mixer.ZERO_ADDRESS) -> PendingUint192:
+        return self._pending_cap.read(id)
     
     def guardian(self, sender = Mixer.ZERO_ADDRESS) -> Address:
         return self._guardian
@@ -12,3 +12,20 @@ from dataclasses import dataclass
 class MarketAllocation:
     market_params: MarketParams = MarketParams()
     assets: int = 0
+
+
+@dataclass
+class LiquiditySnapshot:
+    """
+    Liquidity of a vault at a block: the assets withdrawable from each market
+    of the withdraw queue, their total, and the totals of the vault once its
+    fee is accrued.
+    """
+
+    withdrawable: list[int] = None
+    total_withdrawable: int = 0
+    new_total_supply: int = 0
+    new_total_assets: int = 0
+
+    def liquidity(self) -> int:
+        return self.total_withdrawable
@@ -1,18 +1,23 @@
-from pymorpho.utils.Mixer import Mixer, Metadata, Address, ChainID, InstanceType
+from pymorpho.utils.Mixer import Mixer, Metadata, Address, ChainID, InstanceType, World
 from collections import defaultdict
+from dataclasses import replace
+
+
 class MockOracle:
     def __init__(
         self,
         metadata: Metadata = Metadata(
             ChainID.ETH_MAINNET, Address.ZERO_ADDRESS, "MockOracle", InstanceType.CONTRACT
         ),
-        sender = Mixer.ZERO_ADDRESS
+        sender = Mixer.ZERO_ADDRESS,
+        world: World = Mixer.world,
     ):
         self._price: int = 0
-        self.metadata = metadata
+        self.metadata = replace(metadata)
+        self.world = world
     
     def deploy(self) -> Address:
-        self.metadata.address = Mixer.register(self)
+        self.metadata.address = self.world.register(self)
         return self.metadata.address
     
     def price(self, sender = Mixer.ZERO_ADDRESS) -> int: return self._price
@@ -1,4 +1,4 @@
-from pymorpho.utils.Mixer import Mixer, Address, ChainID, Metadata, InstanceType
+from pymorpho.utils.Mixer import Mixer, Address, ChainID, Metadata, InstanceType, World
 from pymorpho.openzeppelin.erc20 import ERC20
 
 
@@ -11,15 +11,14 @@ class Token(ERC20):
         metadata: Metadata = Metadata(
             ChainID.ETH_MAINNET, Address.ZERO_ADDRESS, "Token", InstanceType.CONTRACT
         ),
-        sender = Mixer.ZERO_ADDRESS
+        sender = Mixer.ZERO_ADDRESS,
+        world: World = Mixer.world,
     ) -> Address:
-        super().__init__(name_, symbol_, metadata, sender)
+        super().__init__(name_, symbol_, metadata, sender, world)
         self._decimals: int = decimals
 
-        self.metadata = metadata
-
     def deploy(self) -> Address:
-        self.metadata.address = Mixer.register(self)
+        self.metadata.address = self.world.register(self)
         return self.metadata.address
 
     def decimals(self) -> int:
@@ -29,6 +28,15 @@ class Token(ERC20):
         self._mint(account, amount)
         return amount
 
+    def mint_many(
+        self,
+        accounts: list[Address],
+        amounts: list[int],
+        sender: Address = Mixer.ZERO_ADDRESS,
+    ) -> int:
+        self._mint_many(accounts, amounts)
+        return sum(amounts)
+
     def burn(self, account: Address, amount: int, sender: Address = Mixer.ZERO_ADDRESS) -> int:
         self._burn(account, amount)
         return amount
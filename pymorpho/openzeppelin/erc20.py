@@ -1,7 +1,9 @@
-from pymorpho.utils.Mixer import Mixer, Metadata, Address, ChainID, InstanceType
-from collections import defaultdict
+from pymorpho.utils.Mixer import Mixer, Metadata, Address, ChainID, InstanceType, World
+from pymorpho.openzeppelin.ledger import BalanceLedger
+from pymorpho.utils.storage import Storage
 from typing import Tuple
 from abc import ABC, abstractmethod
+from dataclasses import replace
 
 
 class ERC20(ABC):
@@ -13,9 +15,10 @@ class ERC20(ABC):
             ChainID.ETH_MAINNET, Address.ZERO_ADDRESS, "ERC20", InstanceType.CONTRACT
         ),
         sender: Address = Mixer.ZERO_ADDRESS,
+        world: World = Mixer.world,
     ):
-        self._balances: defaultdict[Address, int] = defaultdict(int)
-        self._allowances: defaultdict[Tuple[Address, Address], int] = defaultdict(int)
+        self._balances: BalanceLedger = BalanceLedger()
+        self._allowances: Storage[Tuple[Address, Address], int] = Storage(int)
         self._total_supply: int = 0
         self._name: str = ""
         self._symbol: str = ""
@@ -24,10 +27,11 @@ class ERC20(ABC):
         self._symbol = symbol_
 
         # Mixer utilities
-        self.metadata = metadata
+        self.metadata = replace(metadata)
+        self.world = world
     
     def deploy(self) -> Address:
-        self.metadata.address = Mixer.register(self)
+        self.metadata.address = self.world.register(self)
         return self.metadata.address
 
     def name(self) -> str:
@@ -45,16 +49,41 @@ class ERC20(ABC):
     def balance_of(self, account: Address, sender = Mixer.ZERO_ADDRESS) -> int:
         return self._balances[account]
 
+    def balance_of_many(
+        self, accounts: list[Address], sender = Mixer.ZERO_ADDRESS
+    ) -> list[int]:
+        return self._balances.get_many(accounts)
+
     def transfer(
         self, to: Address, amount: int, sender: Address = Mixer.ZERO_ADDRESS
     ) -> bool:
         self._transfer(sender, to, amount)
         return True
 
+    def transfer_many(
+        self,
+        recipients: list[Address],
+        amounts: list[int],
+        sender: Address = Mixer.ZERO_ADDRESS,
+    ) -> bool:
+        """
+        Transfers `amounts[i]` from `sender` to `recipients[i]`, for every i.
+        Reverts unless the balance of `sender` covers the total.
+        """
+        assert sender != Address.ZERO_ADDRESS, "ERC20: transfer from the zero address"
+        ids = self._ids_of(recipients, "ERC20: transfer to the zero address")
+        amounts = list(amounts)
+        total = sum(amounts)
+        from_balance = self._balances[sender]
+        assert from_balance >= total, "ERC20: transfer amount exceeds balance"
+        self._balances[sender] = from_balance - total
+        self._balances.add_ids(ids, amounts)
+        return True
+
     def allowance(
         self, owner: Address, spender: Address, sender = Mixer.ZERO_ADDRESS
     ) -> int:
-        return self._allowances[(owner, spender)]
+        return self._allowances.read((owner, spender))
 
     def approve(
         self, spender: Address, amount: int, sender: Address = Mixer.ZERO_ADDRESS
@@ -117,6 +146,19 @@ class ERC20(ABC):
         assert account != Address.ZERO_ADDRESS, "ERC20: mint to the zero address"
         self._update(Mixer.ZERO_ADDRESS, account, amount)
 
+    def _mint_many(self, accounts: list[Address], amounts: list[int]):
+        ids = self._ids_of(accounts, "ERC20: mint to the zero address")
+        amounts = list(amounts)
+        self._balances.add_ids(ids, amounts)
+        self._total_supply += sum(amounts)
+
+    def _ids_of(self, accounts: list[Address], error: str) -> list[int]:
+        # ids of the accounts in the ledger, none of which may be the zero address
+        zero = self._balances.id(Mixer.ZERO_ADDRESS)
+        ids = self._balances.ids(accounts)
+        assert zero not in set(ids), error
+        return ids
+
     def _burn(self, account: Address, amount: int):
         assert account != Address.ZERO_ADDRESS, "ERC20: burn from the zero address"
         self._update(account, Mixer.ZERO_ADDRESS, amount)
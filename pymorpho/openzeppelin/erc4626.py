@@ -1,7 +1,8 @@
 from pymorpho.openzeppelin.erc20 import ERC20
-from pymorpho.utils.Mixer import Mixer, Metadata, Address, ChainID, InstanceType
+from pymorpho.utils.Mixer import Mixer, Metadata, Address, ChainID, InstanceType, World
 from pymorpho.openzeppelin.utils.math.math import Math as OZMath
 from abc import ABC, abstractmethod
+from dataclasses import replace
 
 
 class ERC4626(ERC20, ABC):
@@ -14,18 +15,20 @@ class ERC4626(ERC20, ABC):
             ChainID.ETH_MAINNET, Address.ZERO_ADDRESS, "ERC4626", InstanceType.CONTRACT
         ),
         sender: Address = Mixer.ZERO_ADDRESS,
+        world: World = Mixer.world,
     ):
+        self.world = world
         self._asset = Mixer.ZERO_ADDRESS
         self._underlying_decimals: int = 0
 
-        self._underlying_decimals = Mixer.contracts_and_eoas[asset_].decimals()
+        self._underlying_decimals = self.world.contracts_and_eoas[asset_].decimals()
         self._asset = asset_
-        ERC20.__init__(self, name_, symbol_, metadata, sender)
+        ERC20.__init__(self, name_, symbol_, metadata, sender, world)
 
-        self.metadata = metadata
+        self.metadata = replace(metadata)
     
     def deploy(self) -> Address:
-        self.metadata.address = Mixer.register(self)
+        self.metadata.address = self.world.register(self)
         return self.metadata.address
 
     def decimals(self) -> int:
@@ -36,7 +39,7 @@ class ERC4626(ERC20, ABC):
 
     @abstractmethod
     def total_assets(self) -> int:
-        return Mixer.contracts_and_eoas[self._asset].balance_of(self.metadata.address)
+        return self.world.contracts_and_eoas[self._asset].balance_of(self.metadata.address)
 
     def convert_to_shares(self, assets: int) -> int:
         return self._convert_to_shares(assets, OZMath.Rounding.Floor)
@@ -116,7 +119,7 @@ class ERC4626(ERC20, ABC):
         )
 
     def _deposit(self, caller: Address, receiver: Address, assets: int, shares: int):
-        Mixer.contracts_and_eoas[self._asset].safe_transfer_from(
+        self.world.contracts_and_eoas[self._asset].safe_transfer_from(
             caller, self.metadata.address, assets, self.metadata.address
         )
         self._mint(receiver, shares)
@@ -133,7 +136,7 @@ class ERC4626(ERC20, ABC):
         if caller != owner:
             self._spend_allowance(owner, caller, shares)
         self._burn(owner, shares)
-        Mixer.contracts_and_eoas[self._asset].safe_transfer(
+        self.world.contracts_and_eoas[self._asset].safe_transfer(
             receiver, assets, self.metadata.address
         )
 
@@ -0,0 +1,222 @@
+from pymorpho.utils.Mixer import Address
+from pymorpho.utils.storage import Layered
+from typing import Iterable, Iterator, Optional, Tuple
+
+
+# marks balances that a layer didn't write
+_MISSING = object()
+
+
+class BalanceLedger(Layered):
+    """
+    Balances of an ERC20: every account is interned once to a dense integer
+    id and its balance lives at that index of a plain list.
+
+    It is indexed by address like the default storage, and the `*_many`
+    methods resolve a batch of accounts to ids once and then only touch the
+    list.
+
+    A ledger forked with `child()` starts empty on top of the frozen ledgers
+    it was forked from, like the default storage. Accounts it interns get
+    ids after the ones of its parents, in a table of its own, and balances
+    it writes for accounts of its parents are kept in a dict of overrides, so
+    a branch only costs the accounts and balances it actually touches and
+    never sees the accounts interned by another branch. Frozen ledgers are
+    never written to again, which lets worlds forked from each other run in
+    separate threads. Transactions journal the balances they overwrite and
+    drop the accounts they interned when they revert.
+    """
+
+    __slots__ = ("_ids", "_balances", "_written", "_parents", "_first", "_undo", "_mark")
+
+    # number of frozen ledgers after which a child flattens them into one
+    MAX_DEPTH = 8
+
+    def __init__(
+        self,
+        parents: Tuple["BalanceLedger", ...] = (),
+        first: int = 0,
+    ):
+        # account -> id, for the accounts interned by this ledger
+        self._ids: dict[Address, int] = {}
+        # balance of the account with id `_first + i` at index i
+        self._balances: list[int] = []
+        # id -> balance, for the accounts of the parents written by this ledger
+        self._written: dict[int, int] = {}
+        self._parents = parents
+        # first id handed out by this ledger, after every id of its parents
+        self._first = first
+        # journal of the balances overwritten by the open transaction, and the
+        # number of accounts interned when it was opened
+        self._undo: Optional[dict[int, object]] = None
+        self._mark = 0
+
+    def _find(self, account: Address) -> Optional[int]:
+        id = self._ids.get(account)
+        if id is None:
+            for ledger in self._parents:
+                id = ledger._ids.get(account)
+                if id is not None:
+                    break
+        return id
+
+    def _intern(self, account: Address) -> int:
+        id = self._ids[account] = self._first + len(self._ids)
+        self._balances.append(0)
+        return id
+
+    def id(self, account: Address) -> int:
+        """Id of `account`, interning it if it's new."""
+        id = self._find(account)
+        if id is None:
+            id = self._intern(account)
+        return id
+
+    def ids(self, accounts: Iterable[Address]) -> list[int]:
+        find = self._find
+        intern = self._intern
+        result = []
+        for account in accounts:
+            id = find(account)
+            if id is None:
+                id = intern(account)
+            result.append(id)
+        return result
+
+    def _balance(self, id: int) -> int:
+        if id >= self._first:
+            return self._balances[id - self._first]
+        balance = self._written.get(id, _MISSING)
+        if balance is not _MISSING:
+            return balance
+        for ledger in self._parents:
+            if id >= ledger._first:
+                return ledger._balances[id - ledger._first]
+            balance = ledger._written.get(id, _MISSING)
+            if balance is not _MISSING:
+                return balance
+        return 0
+
+    def _set(self, id: int, value: int):
+        undo = self._undo
+        if id >= self._first:
+            index = id - self._first
+            # accounts interned by the transaction are dropped as a whole
+            if undo is not None and index < self._mark and id not in undo:
+                undo[id] = self._balances[index]
+            self._balances[index] = value
+        else:
+            if undo is not None and id not in undo:
+                undo[id] = self._written.get(id, _MISSING)
+            self._written[id] = value
+
+    def __getitem__(self, account: Address) -> int:
+        id = self._find(account)
+        return 0 if id is None else self._balance(id)
+
+    def __setitem__(self, account: Address, value: int):
+        self._set(self.id(account), value)
+
+    def __contains__(self, account: Address) -> bool:
+        return self[account] != 0
+
+    def __iter__(self) -> Iterator[Address]:
+        return (account for account, _ in self.items())
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.items())
+
+    def get(self, account: Address, default: int = None) -> Optional[int]:
+        balance = self[account]
+        return balance if balance != 0 else default
+
+    def items(self) -> Iterator[Tuple[Address, int]]:
+        """Accounts with a non-zero balance and their balance."""
+        balance = self._balance
+        for ledger in reversed((self,) + self._parents):
+            for account, id in ledger._ids.items():
+                value = balance(id)
+                if value != 0:
+                    yield account, value
+
+    def get_many(self, accounts: Iterable[Address]) -> list[int]:
+        find = self._find
+        if not self._parents:
+            balances = self._balances
+            return [
+                balances[id] if id is not None else 0
+                for id in map(find, accounts)
+            ]
+        balance = self._balance
+        return [
+            balance(id) if id is not None else 0 for id in map(find, accounts)
+        ]
+
+    def add_many(self, accounts: Iterable[Address], amounts: Iterable[int]):
+        """Adds `amounts[i]` to the balance of `accounts[i]`, for every i."""
+        self.add_ids(self.ids(accounts), amounts)
+
+    def add_ids(self, ids: Iterable[int], amounts: Iterable[int]):
+        if not self._parents and self._undo is None:
+            balances = self._balances
+            for id, amount in zip(ids, amounts):
+                balances[id] += amount
+            return
+        balance = self._balance
+        set = self._set
+        for id, amount in zip(ids, amounts):
+            set(id, balance(id) + amount)
+
+    def child(self) -> "BalanceLedger":
+        """
+        Returns an empty ledger on top of this one. This ledger is frozen from
+        then on and must not be written to anymore.
+        """
+        if self._ids or self._written:
+            parents = (self,) + self._parents
+        else:
+            parents = self._parents
+        first = self._first + len(self._ids)
+        if len(parents) > BalanceLedger.MAX_DEPTH:
+            parents = (BalanceLedger(parents, first)._flattened(),)
+        return BalanceLedger(parents, first)
+
+    def sibling(self) -> "BalanceLedger":
+        """Returns an empty ledger sharing this ledger's frozen parents."""
+        return BalanceLedger(self._parents, self._first)
+
+    def _flattened(self) -> "BalanceLedger":
+        # a single ledger with the accounts and balances of this one
+        flat = BalanceLedger()
+        for ledger in reversed((self,) + self._parents):
+            flat._ids.update(ledger._ids)
+        flat._balances = [self._balance(id) for id in range(len(flat._ids))]
+        return flat
+
+    def layer(self) -> "BalanceLedger":
+        # writes go straight to this ledger, the journal reverts them
+        layer = BalanceLedger(self._parents, self._first)
+        layer._ids = self._ids
+        layer._balances = self._balances
+        layer._written = self._written
+        layer._undo = {}
+        layer._mark = len(self._ids)
+        return layer
+
+    def merge(self, layer: "BalanceLedger"):
+        if self._undo is not None:
+            for id, saved in layer._undo.items():
+                self._undo.setdefault(id, saved)
+
+    def discard(self, layer: "BalanceLedger"):
+        for id, saved in layer._undo.items():
+            if id >= self._first:
+                self._balances[id - self._first] = saved
+            elif saved is _MISSING:
+                del self._written[id]
+            else:
+                self._written[id] = saved
+        ids = self._ids
+        while len(ids) > layer._mark:
+            ids.popitem()
+        del self._balances[layer._mark :]
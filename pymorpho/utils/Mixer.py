@@ -1,9 +1,11 @@
 from collections import defaultdict
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Callable, Optional
 from enum import Enum
-from eth_abi import encode
-import hashlib
+from weakref import WeakValueDictionary
+from pymorpho.utils.scheduler import Event, Scheduler
+from pymorpho.utils.storage import Journal, branch, storage_size
 
 
 class ChainID(Enum):
@@ -16,41 +18,75 @@ class InstanceType(Enum):
     CONTRACT = 1
 
 
+# every address still alive, so that equal addresses are the same object;
+# weak so that the addresses of dropped worlds are freed with them
+_ADDRESSES: "WeakValueDictionary[str, Address]" = WeakValueDictionary()
+
+
 class Address(str):
-    ADDRESS_SALT: int = 0
+    """
+    An address, compared and hashed as the string it is. Addresses are
+    interned: building one returns the existing object for that string, so
+    the lookups of the maps keyed by address mostly succeed on identity.
+    The table only holds weak references and never outlives the addresses.
+    """
+
+    __slots__ = ("__weakref__",)
 
     ZERO_ADDRESS: str = "0x0000000000000000000000000000000000000000"
 
-    def __init__(self, x: object):
-        if hasattr(x, "metadata"):
-            self.address = str(x.metadata.address)
-        elif isinstance(x, str):
-            self.address = x
-        else:
-            raise ValueError("Address must be either a string or a contract.")
+    def __new__(cls, x: object):
+        if not isinstance(x, str):
+            if not hasattr(x, "metadata"):
+                raise ValueError("Address must be either a string or a contract.")
+            x = str(x.metadata.address)
+        address = _ADDRESSES.get(x)
+        if address is None:
+            address = str.__new__(cls, x)
+            _ADDRESSES[str(address)] = address
+        return address
+
+    @property
+    def address(self) -> str:
+        return str(self)
 
     @staticmethod
     def new(chain: ChainID = ChainID.ETH_MAINNET):
-        Address.ADDRESS_SALT = Address.ADDRESS_SALT + 1
-        k = hashlib.sha3_256()
-        k.update(
-            encode(
-                ["bytes32", "int"], [bytes(str(chain), "utf-8"), Address.ADDRESS_SALT]
-            )
-        )
-        return Address(f"0x{k.hexdigest()[:40]}")
+        # addresses minted outside of a world come from the default world
+        return Mixer.world.new_address(chain)
 
-    def __str__(self) -> str:
-        return self.address
+    @staticmethod
+    def new_many(count: int, chain: ChainID = ChainID.ETH_MAINNET) -> list["Address"]:
+        return Mixer.world.new_addresses(count, chain)
 
-    def __repr__(self) -> str:
-        return self.address
+    @staticmethod
+    def derive(chain: ChainID, salt: int):
+        return Address.derive_many(chain, salt, 1)[0]
+
+    @staticmethod
+    def derive_many(chain: ChainID, first_salt: int, count: int) -> list["Address"]:
+        """
+        The addresses derived from the salts `first_salt`, ...,
+        `first_salt + count - 1`: the first 20 bytes of the sha3 of the ABI
+        encoding of `(bytes32 chain, int256 salt)`.
+        """
+        import hashlib
 
-    def __eq__(self, other) -> bool:
-        return self.address == other.__str__()
+        # abi.encode of the bytes32 is the same for every salt
+        prefix = hashlib.sha3_256(bytes(str(chain), "utf-8").ljust(32, b"\0"))
+        addresses = []
+        for salt in range(first_salt, first_salt + count):
+            k = prefix.copy()
+            k.update(salt.to_bytes(32, "big", signed=True))
+            x = "0x" + k.hexdigest()[:40]
+            address = _ADDRESSES.get(x)
+            if address is None:
+                address = _ADDRESSES[x] = str.__new__(Address, x)
+            addresses.append(address)
+        return addresses
 
-    def __hash__(self) -> int:
-        return hash(self.address)
+    def __repr__(self) -> str:
+        return str(self)
 
 
 @dataclass
@@ -61,26 +97,286 @@ class Metadata:
     type: InstanceType = InstanceType.EOA
 
 
-class Mixer:
-    block_timestamps: defaultdict[ChainID, int] = defaultdict(int)
-    contracts_and_eoas: dict[Address, Any] = {}
-    ZERO_ADDRESS = Address("0x0000000000000000000000000000000000000000")
+class World:
+    """
+    A self-contained simulation: the registry of deployed contracts and EOAs,
+    the block clock of every chain and the address allocator.
 
-    def register(thingy: Any) -> Address:
+    Contracts resolve their peers and read the time through the world they
+    were constructed in, so independent worlds can run side by side (one per
+    thread, one per Monte Carlo path, ...) without sharing any state.
+    """
+
+    def __init__(self):
+        self.block_timestamps: defaultdict[ChainID, int] = defaultdict(int)
+        self.contracts_and_eoas: dict[Address, Any] = {}
+        self.address_salt: int = 0
+        # frozen copies of the world, indexed by snapshot id
+        self._snapshots: list["World"] = []
+        # number of transactions currently open
+        self._transaction_depth: int = 0
+        # settings of the approximate interest rates, None for exact rates
+        self.approximate_rates: Any = None
+        # actions scheduled to run when the clock reaches them
+        self.scheduler: Scheduler = Scheduler()
+
+    def new_address(self, chain: ChainID = ChainID.ETH_MAINNET) -> Address:
+        self.address_salt = self.address_salt + 1
+        return Address.derive(chain, self.address_salt)
+
+    def new_addresses(
+        self, count: int, chain: ChainID = ChainID.ETH_MAINNET
+    ) -> list[Address]:
+        """The next `count` addresses of `new_address`, derived in one pass."""
+        addresses = Address.derive_many(chain, self.address_salt + 1, count)
+        self.address_salt = self.address_salt + count
+        return addresses
+
+    def register(self, thingy: Any) -> Address:
         final_address = (
-            Address.new(thingy.metadata.chain)
+            self.new_address(thingy.metadata.chain)
             if (
                 thingy.metadata.address == Address.ZERO_ADDRESS
-                or thingy.metadata.address in Mixer.contracts_and_eoas.keys()
+                or thingy.metadata.address in self.contracts_and_eoas.keys()
             )
             else thingy.metadata.address
         )
 
-        Mixer.contracts_and_eoas[final_address] = thingy
+        self.contracts_and_eoas[final_address] = thingy
         return final_address
 
+    def storage_size(self) -> dict[Address, int]:
+        """
+        Number of storage entries held by each contract of the world, which
+        grows with the slots written and not with the slots read.
+        """
+        return {
+            address: sum(storage_size(thingy).values())
+            for address, thingy in self.contracts_and_eoas.items()
+        }
+
+    def block_timestamp(self, chain: ChainID = ChainID.ETH_MAINNET) -> int:
+        return self.block_timestamps[chain]
+
+    def set_block_timestamp(
+        self, timestamp: int, chain: ChainID = ChainID.ETH_MAINNET
+    ):
+        self.block_timestamps[chain] = timestamp
+
+    def schedule(
+        self, timestamp: int, address: Address, function: str, *args, **kwargs
+    ) -> Event:
+        """
+        Schedules the call `function(*args, **kwargs)` on the contract at
+        `address`, run as a transaction when the clock of its chain reaches
+        `timestamp` through `advance_to`. An event that raises undoes the
+        whole `advance_to` it ran in, as described there. Returns the event,
+        which can be passed to `cancel`.
+        """
+        chain = self.contracts_and_eoas[address].metadata.chain
+        return self.scheduler.push(chain, timestamp, address, function, args, kwargs)
+
+    def schedule_callback(
+        self,
+        timestamp: int,
+        callback: Callable[["World"], Any],
+        chain: ChainID = ChainID.ETH_MAINNET,
+    ) -> Event:
+        """Schedules `callback(world)` like `schedule` schedules a call."""
+        return self.scheduler.push(chain, timestamp, callback)
+
+    def cancel(self, event: Event):
+        self.scheduler.cancel(event)
+
+    def next_event_timestamp(
+        self, chain: ChainID = ChainID.ETH_MAINNET
+    ) -> Optional[int]:
+        return self.scheduler.next_timestamp(chain)
+
+    def advance_to(
+        self,
+        timestamp: int,
+        granularity: int = None,
+        chain: ChainID = ChainID.ETH_MAINNET,
+    ):
+        """
+        Moves the block clock of `chain` forward to `timestamp`, accruing
+        interest on the way as if every market were accrued each `granularity`
+        seconds and at `timestamp`, which is bit-exact with stepping the clock
+        and calling `accrue_interest` by hand. Without a granularity, markets
+        are accrued once at `timestamp`.
+
+        Scheduled events due by `timestamp` run on the way, in order, with the
+        clock set to their timestamp; the accrual steps stay on the grid of
+        `granularity` seconds from the current time.
+
+        The advance runs as one transaction: if an event raises, the clock,
+        the accruals and the events already run are all undone, the failing
+        event stays scheduled, and the exception propagates.
+
+        Contracts take part by implementing `fast_forward(start, end,
+        granularity)`.
+        """
+        start = self.block_timestamp(chain)
+        assert timestamp >= start, "cannot go back in time"
+        if granularity is None:
+            granularity = max(timestamp - start, 1)
+        assert granularity > 0, "granularity must be positive"
+        with self.transaction():
+            self._advance_to(start, timestamp, granularity, chain)
+
+    def _advance_to(self, start: int, timestamp: int, granularity: int, chain: ChainID):
+        accrued = start
+        while True:
+            event_timestamp = self.scheduler.next_timestamp(chain)
+            if event_timestamp is None or event_timestamp > timestamp:
+                break
+            now = max(event_timestamp, self.block_timestamp(chain))
+            step = start + (now - start) // granularity * granularity
+            self._fast_forward(accrued, step, granularity, chain)
+            accrued = max(accrued, step)
+            self.set_block_timestamp(now, chain)
+            event = self.scheduler.pop(chain, now)
+            if event.function is None:
+                event.target(self)
+            else:
+                getattr(self.contracts_and_eoas[event.target], event.function)(
+                    *event.args, **event.kwargs
+                )
+        self._fast_forward(accrued, timestamp, granularity, chain)
+        self.set_block_timestamp(timestamp, chain)
+
+    def advance_to_next_event(
+        self,
+        until: int = None,
+        granularity: int = None,
+        chain: ChainID = ChainID.ETH_MAINNET,
+    ) -> Optional[int]:
+        """
+        Advances the clock of `chain` straight to its next scheduled event, or
+        to `until` if that comes first, running every event due then. Returns
+        the new time, or None if there was nowhere to go.
+        """
+        timestamp = self.scheduler.next_timestamp(chain)
+        if timestamp is None or (until is not None and timestamp > until):
+            timestamp = until
+        if timestamp is None:
+            return None
+        timestamp = max(timestamp, self.block_timestamp(chain))
+        self.advance_to(timestamp, granularity, chain)
+        return timestamp
+
+    def _fast_forward(self, start: int, end: int, granularity: int, chain: ChainID):
+        if end <= start:
+            return
+        for thingy in list(self.contracts_and_eoas.values()):
+            fast_forward = getattr(thingy, "fast_forward", None)
+            if fast_forward is not None and thingy.metadata.chain == chain:
+                fast_forward(start, end, granularity)
+
+    def fork(self) -> "World":
+        """
+        Returns an independent copy of this world. Contract storages are
+        shared copy-on-write, so forking doesn't depend on the size of the
+        state and a branch only pays for the entries it changes.
+        """
+        assert self._transaction_depth == 0, "cannot fork inside a transaction"
+        world = World()
+        world.block_timestamps.update(self.block_timestamps)
+        world.address_salt = self.address_salt
+        world.approximate_rates = self.approximate_rates
+        world.scheduler = self.scheduler.copy()
+        for address, thingy in self.contracts_and_eoas.items():
+            world.contracts_and_eoas[address] = branch(thingy, world)
+        return world
+
+    def snapshot(self) -> int:
+        self._snapshots.append(self.fork())
+        return len(self._snapshots) - 1
+
+    def rollback(self, snapshot_id: int):
+        """
+        Restores the state of the world at `snapshot_id`, including its
+        `approximate_rates` setting. Contract objects are updated in place,
+        contracts deployed after the snapshot are dropped and snapshots taken
+        after it are discarded. The snapshot itself stays valid and can be
+        rolled back to again.
+        """
+        assert self._transaction_depth == 0, "cannot rollback inside a transaction"
+        saved = self._snapshots[snapshot_id]
+        del self._snapshots[snapshot_id + 1 :]
+
+        contracts_and_eoas = {}
+        for address, thingy in saved.contracts_and_eoas.items():
+            restored = branch(thingy, self)
+            live = self.contracts_and_eoas.get(address)
+            if live is not None:
+                live.__dict__.clear()
+                live.__dict__.update(vars(restored))
+                restored = live
+            contracts_and_eoas[address] = restored
+        self.contracts_and_eoas.clear()
+        self.contracts_and_eoas.update(contracts_and_eoas)
+        self.block_timestamps.clear()
+        self.block_timestamps.update(saved.block_timestamps)
+        self.address_salt = saved.address_salt
+        self.approximate_rates = saved.approximate_rates
+        self.scheduler = saved.scheduler.copy()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs the body of the `with` block atomically: if it raises, every
+        write it made to the contracts of the world is undone before the
+        exception propagates. Transactions can be nested, an inner one that
+        fails only undoes its own writes.
+
+            with world.transaction():
+                morpho.borrow(market_params, assets, 0, borrower, borrower, borrower)
+        """
+        thingies = {id(thingy): thingy for thingy in self.contracts_and_eoas.values()}
+        journal = Journal(thingies.values())
+        contracts_and_eoas = dict(self.contracts_and_eoas)
+        block_timestamps = dict(self.block_timestamps)
+        address_salt = self.address_salt
+        approximate_rates = self.approximate_rates
+        scheduler = self.scheduler.copy()
+        self._transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            journal.revert()
+            self.contracts_and_eoas.clear()
+            self.contracts_and_eoas.update(contracts_and_eoas)
+            self.block_timestamps.clear()
+            self.block_timestamps.update(block_timestamps)
+            self.address_salt = address_salt
+            self.approximate_rates = approximate_rates
+            self.scheduler = scheduler
+            raise
+        else:
+            journal.commit()
+        finally:
+            self._transaction_depth -= 1
+
+    def call(self, function, *args, **kwargs):
+        """Calls `function` inside a transaction and returns its result."""
+        with self.transaction():
+            return function(*args, **kwargs)
+
+
+class Mixer:
+    # default world, used by every contract that isn't given one explicitly
+    world: World = World()
+    block_timestamps: defaultdict[ChainID, int] = world.block_timestamps
+    contracts_and_eoas: dict[Address, Any] = world.contracts_and_eoas
+    ZERO_ADDRESS = Address("0x0000000000000000000000000000000000000000")
+
+    def register(thingy: Any) -> Address:
+        return Mixer.world.register(thingy)
+
     def block_timestamp(chain: ChainID = ChainID.ETH_MAINNET) -> int:
-        return Mixer.block_timestamps[chain]
+        return Mixer.world.block_timestamp(chain)
 
     def set_block_timestamp(timestamp: int, chain: ChainID = ChainID.ETH_MAINNET):
-        Mixer.block_timestamps[chain] = timestamp
+        Mixer.world.set_block_timestamp(timestamp, chain)
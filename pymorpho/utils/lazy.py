@@ -0,0 +1,44 @@
+from importlib import import_module
+from threading import Lock
+from typing import Any
+
+
+class _LazyModule:
+    """
+    Stand-in for a module which imports it on the first access to one of its
+    attributes, then keeps the attributes it hands out so that later accesses
+    don't go through it.
+    """
+
+    def __init__(self, name: str):
+        self._lazy_name = name
+        self._lazy_lock = Lock()
+        self._lazy_module = None
+
+    def _load(self):
+        with self._lazy_lock:
+            if self._lazy_module is None:
+                self._lazy_module = import_module(self._lazy_name)
+        return self._lazy_module
+
+    def __getattr__(self, attribute: str) -> Any:
+        value = getattr(self._load(), attribute)
+        self.__dict__[attribute] = value
+        return value
+
+    def __repr__(self) -> str:
+        return f"<lazy module '{self._lazy_name}'>"
+
+
+def lazy_import(name: str) -> Any:
+    """
+    The module `name`, only imported on the first access to one of its
+    attributes. Modules that only need a heavy dependency in a few functions
+    import it this way so that importing them stays cheap.
+
+    The stand-in isn't registered in `sys.modules`: the module is imported
+    normally, under a lock, the first time it's needed, so threads racing on
+    that first access and every other importer of `name` get the fully
+    executed module.
+    """
+    return _LazyModule(name)
@@ -0,0 +1,78 @@
+from dataclasses import dataclass, field
+from heapq import heappop, heappush
+from typing import Any, Optional
+
+
+@dataclass(frozen=True, order=True)
+class Event:
+    """
+    An action due at `timestamp`: either the call `function(*args, **kwargs)`
+    on the contract at address `target`, or, without a function, the callback
+    `target(world)`. Events due at the same time run in scheduling order.
+    """
+
+    timestamp: int
+    sequence: int
+    target: Any = field(default=None, compare=False)
+    function: Optional[str] = field(default=None, compare=False)
+    args: tuple = field(default=(), compare=False)
+    kwargs: dict = field(default_factory=dict, compare=False)
+
+
+class Scheduler:
+    """
+    Events of a world, one priority queue per chain ordered by timestamp.
+
+    Events are immutable and cancelling one only marks its sequence number,
+    so a copy of the scheduler only copies the queues, not the events.
+    """
+
+    def __init__(self):
+        self._queues: dict[Any, list[Event]] = {}
+        self._cancelled: set[int] = set()
+        self._sequence: int = 0
+
+    def push(
+        self,
+        chain: Any,
+        timestamp: int,
+        target: Any,
+        function: Optional[str] = None,
+        args: tuple = (),
+        kwargs: dict = None,
+    ) -> Event:
+        self._sequence = self._sequence + 1
+        event = Event(timestamp, self._sequence, target, function, args, kwargs or {})
+        heappush(self._queues.setdefault(chain, []), event)
+        return event
+
+    def cancel(self, event: Event):
+        self._cancelled.add(event.sequence)
+
+    def next_timestamp(self, chain: Any) -> Optional[int]:
+        queue = self._queues.get(chain)
+        while queue and queue[0].sequence in self._cancelled:
+            self._cancelled.discard(heappop(queue).sequence)
+        return queue[0].timestamp if queue else None
+
+    def pop(self, chain: Any, timestamp: int) -> Optional[Event]:
+        """Removes and returns the next event of `chain` due at `timestamp`."""
+        next_timestamp = self.next_timestamp(chain)
+        if next_timestamp is None or next_timestamp > timestamp:
+            return None
+        return heappop(self._queues[chain])
+
+    def pending(self, chain: Any) -> list[Event]:
+        """Events of `chain` that haven't run yet, in the order they will."""
+        return sorted(
+            event
+            for event in self._queues.get(chain, [])
+            if event.sequence not in self._cancelled
+        )
+
+    def copy(self) -> "Scheduler":
+        scheduler = Scheduler()
+        scheduler._queues = {chain: list(queue) for chain, queue in self._queues.items()}
+        scheduler._cancelled = set(self._cancelled)
+        scheduler._sequence = self._sequence
+        return scheduler
@@ -0,0 +1,354 @@
+from copy import copy
+from itertools import count
+from dataclasses import is_dataclass
+from typing import Any, Callable, Iterator, Tuple
+
+
+# values that can be shared between branches without being copied
+_IMMUTABLE = (int, bool, str, bytes, tuple, frozenset, type(None))
+_IMMUTABLE_TYPES = frozenset(_IMMUTABLE)
+
+# attributes set once at construction and deployment, never journaled
+_CONSTANT_ATTRIBUTES = frozenset(("metadata", "world"))
+
+# marks keys missing from a dict
+_MISSING = object()
+
+
+def _own(value: Any) -> Any:
+    return value if isinstance(value, _IMMUTABLE) else copy(value)
+
+
+def _is_mutable(value: Any) -> bool:
+    if isinstance(value, _IMMUTABLE):
+        return False
+    return isinstance(value, (list, dict, set)) or (
+        is_dataclass(value) and not isinstance(value, type)
+    )
+
+
+class Layered:
+    """
+    Interface of the contract storages that a World can branch and journal.
+
+    `child()` and `sibling()` fork the storage copy-on-write: the storage
+    they're called on is frozen, `child()` replaces it in the contract and
+    `sibling()` of that child goes to the branch. `layer()` opens a journal
+    layer which is either folded back with `merge(layer)` or dropped with
+    `discard(layer)`.
+    """
+
+    __slots__ = ()
+
+    def child(self) -> "Layered":
+        raise NotImplementedError
+
+    def sibling(self) -> "Layered":
+        raise NotImplementedError
+
+    def layer(self) -> "Layered":
+        raise NotImplementedError
+
+    def merge(self, layer: "Layered"):
+        raise NotImplementedError
+
+    def discard(self, layer: "Layered"):
+        raise NotImplementedError
+
+
+class Storage(dict, Layered):
+    """
+    Contract storage: a dict that behaves like a `defaultdict` and can be
+    branched copy-on-write.
+
+    A storage forked with `child()` starts empty on top of the frozen layers
+    it was forked from. Missing keys are looked up in those layers and the
+    value found is copied into the child before being returned, so in-place
+    updates such as `self._market[id].fee = fee` never leak into the shared
+    layers. A branch therefore only costs the entries it actually touches.
+    """
+
+    __slots__ = ("default_factory", "_parents")
+
+    # number of frozen layers after which a child flattens them into one
+    MAX_DEPTH = 8
+
+    def __init__(
+        self,
+        default_factory: Callable[[], Any] = None,
+        parents: Tuple["Storage", ...] = (),
+    ):
+        super().__init__()
+        self.default_factory = default_factory
+        self._parents = parents
+
+    def __missing__(self, key):
+        for layer in self._parents:
+            if dict.__contains__(layer, key):
+                value = _own(dict.__getitem__(layer, key))
+                dict.__setitem__(self, key, value)
+                return value
+        if self.default_factory is None:
+            raise KeyError(key)
+        value = self.default_factory()
+        dict.__setitem__(self, key, value)
+        return value
+
+    def __contains__(self, key) -> bool:
+        if dict.__contains__(self, key):
+            return True
+        return any(dict.__contains__(layer, key) for layer in self._parents)
+
+    def __iter__(self) -> Iterator:
+        if not self._parents:
+            return dict.__iter__(self)
+        return iter(self._merged())
+
+    def __len__(self) -> int:
+        if not self._parents:
+            return dict.__len__(self)
+        return len(self._merged())
+
+    def __repr__(self) -> str:
+        return f"Storage({self._merged()!r})"
+
+    def read(self, key):
+        """
+        The value at `key` without writing anything: a missing key reads as a
+        fresh default which isn't stored, and values of the frozen layers
+        aren't copied, so the value must not be modified in place. View
+        functions read through this so that probing keys doesn't grow the
+        storage.
+        """
+        value = dict.get(self, key, _MISSING)
+        if value is not _MISSING:
+            return value
+        for layer in self._parents:
+            value = dict.get(layer, key, _MISSING)
+            if value is not _MISSING:
+                return value
+        if self.default_factory is None:
+            raise KeyError(key)
+        return self.default_factory()
+
+    def get(self, key, default=None):
+        if dict.__contains__(self, key):
+            return dict.__getitem__(self, key)
+        for layer in self._parents:
+            if dict.__contains__(layer, key):
+                return dict.__getitem__(layer, key)
+        return default
+
+    def keys(self):
+        return self._merged().keys()
+
+    def values(self):
+        return self._merged().values()
+
+    def items(self):
+        return self._merged().items()
+
+    def child(self) -> "Storage":
+        """
+        Returns an empty storage layered on top of this one. This storage is
+        frozen from then on and must not be written to anymore.
+        """
+        parents = (self,) + self._parents if dict.__len__(self) else self._parents
+        if len(parents) > Storage.MAX_DEPTH:
+            flat = Storage()
+            dict.update(flat, self._merged())
+            parents = (flat,)
+        return Storage(self.default_factory, parents)
+
+    def sibling(self) -> "Storage":
+        """Returns an empty storage sharing this storage's frozen layers."""
+        return Storage(self.default_factory, self._parents)
+
+    def layer(self) -> "Storage":
+        return Storage(self.default_factory, (self,) + self._parents)
+
+    def merge(self, layer: "Storage"):
+        """Folds the entries written in `layer` back into this storage."""
+        if dict.__len__(layer):
+            dict.update(self, dict.items(layer))
+
+    def discard(self, layer: "Storage"):
+        pass
+
+    def _merged(self) -> dict:
+        merged = {}
+        for layer in reversed(self._parents):
+            dict.update(merged, dict.items(layer))
+        dict.update(merged, dict.items(self))
+        return merged
+
+
+class Memo(Layered):
+    """
+    Cache of values derived from the state of a contract, one entry per slot.
+
+    Each entry is stored along with the key it was computed for, which must
+    capture everything the value depends on, so an entry whose key no longer
+    matches the state is simply missed. Entries thus survive reverted
+    transactions, and forks start with an empty memo.
+    """
+
+    __slots__ = ("_entries",)
+
+    def __init__(self):
+        self._entries: dict[Any, Tuple[Any, Any]] = {}
+
+    def get(self, slot, key) -> Any:
+        entry = self._entries.get(slot)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        return None
+
+    def put(self, slot, key, value):
+        self._entries[slot] = (key, value)
+
+    def clear(self):
+        self._entries.clear()
+
+    def child(self) -> "Memo":
+        return self
+
+    def sibling(self) -> "Memo":
+        return Memo()
+
+    def layer(self) -> "Memo":
+        return self
+
+    def merge(self, layer: "Memo"):
+        pass
+
+    def discard(self, layer: "Memo"):
+        pass
+
+
+class Versions(Layered):
+    """
+    Version of each slot of a contract, bumped on every write to the slot,
+    for keying memos.
+
+    Versions are drawn from a clock that only moves forward and is shared by
+    every branch, and a reverted transaction bumps again the slots it wrote
+    to, so a version is never seen twice: a memo keyed on it can't return a
+    value computed on a reverted or forked state.
+    """
+
+    __slots__ = ("_versions", "_clock", "_touched")
+
+    def __init__(
+        self,
+        versions: dict[Any, int] = None,
+        clock: Iterator[int] = None,
+        touched: set = None,
+    ):
+        self._versions: dict[Any, int] = {} if versions is None else versions
+        self._clock = count(1) if clock is None else clock
+        # slots bumped by the open transaction
+        self._touched = touched
+
+    def get(self, slot) -> int:
+        return self._versions.get(slot, 0)
+
+    def bump(self, slot):
+        self._versions[slot] = next(self._clock)
+        if self._touched is not None:
+            self._touched.add(slot)
+
+    def __len__(self) -> int:
+        return len(self._versions)
+
+    def child(self) -> "Versions":
+        return self
+
+    def sibling(self) -> "Versions":
+        return Versions(dict(self._versions), self._clock)
+
+    def layer(self) -> "Versions":
+        return Versions(self._versions, self._clock, set())
+
+    def merge(self, layer: "Versions"):
+        if self._touched is not None:
+            self._touched |= layer._touched
+
+    def discard(self, layer: "Versions"):
+        for slot in layer._touched:
+            self.bump(slot)
+
+
+def storage_size(thingy: Any) -> dict[str, int]:
+    """
+    Number of entries held by each storage of the contract `thingy`, not
+    counting the memos and versions, which are bounded by the slots they
+    describe.
+    """
+    return {
+        name: len(value)
+        for name, value in vars(thingy).items()
+        if isinstance(value, Layered) and not isinstance(value, (Memo, Versions))
+    }
+
+
+def branch(thingy: Any, world: Any) -> Any:
+    """
+    Returns a copy of the contract `thingy` living in `world`. Storages are
+    shared copy-on-write, every other mutable attribute is copied.
+    """
+    clone = copy(thingy)
+    for name, value in list(vars(thingy).items()):
+        if isinstance(value, Layered):
+            live = value.child()
+            setattr(thingy, name, live)
+            setattr(clone, name, live.sibling())
+        elif _is_mutable(value):
+            setattr(clone, name, copy(value))
+    clone.world = world
+    return clone
+
+
+class Journal:
+    """
+    Undo journal of a transaction over a set of contracts.
+
+    Every storage of the contracts gets a journal layer on top of it which
+    receives the writes of the transaction, and the other attributes are
+    saved as they were. Committing folds the layers back into the storages,
+    reverting drops them and restores the saved attributes. The cost of a
+    transaction is proportional to the entries it touches, not to the size
+    of the state.
+    """
+
+    def __init__(self, thingies: Iterator[Any]):
+        self._saved: list[Tuple[Any, dict]] = []
+        self._layers: list[Tuple[Any, str, Layered, Layered]] = []
+        for thingy in thingies:
+            state = vars(thingy)
+            saved = dict(state)
+            for name, value in saved.items():
+                if type(value) in _IMMUTABLE_TYPES or name in _CONSTANT_ATTRIBUTES:
+                    continue
+                if isinstance(value, Layered):
+                    layer = value.layer()
+                    state[name] = layer
+                    self._layers.append((thingy, name, value, layer))
+                elif _is_mutable(value):
+                    saved[name] = copy(value)
+            self._saved.append((thingy, saved))
+
+    def commit(self):
+        for thingy, name, value, layer in self._layers:
+            value.merge(layer)
+            state = vars(thingy)
+            if state.get(name) is layer:
+                state[name] = value
+
+    def revert(self):
+        for _, _, value, layer in reversed(self._layers):
+            value.discard(layer)
+        for thingy, saved in self._saved:
+            state = vars(thingy)
+            state.clear()
+            state.update(saved)
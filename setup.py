@@ -1,4 +1,4 @@
-from distutils.core import setup
+from setuptools import setup
 setup(
   name = 'pymorpho',         # How you named your package folder (MyLib)
   packages = ['pymorpho'],   # Chose the same as "name"
@@ -10,8 +10,9 @@ setup(
   url = 'https://github.com/kakagri/pymorpho',   # Provide either the link to your github or to your website
   download_url = '',    # I explain this later on
   keywords = ['morpho', 'simulation', 'crypto', 'ml'],   # Keywords that define your package best
+  python_requires='>=3.10',
   install_requires=[           # I get to this in a second 
-      'eth-abi',
+      'eth-hash[pycryptodome]',
       'numpy',
       ],
   classifiers=[
@@ -20,8 +21,8 @@ setup(
     'Topic :: Software Development :: Build Tools',
     'License :: OSI Approved :: MIT License',   # Again, pick a license
     'Programming Language :: Python :: 3',      #Specify which pyhton versions that you want to support
-    'Programming Language :: Python :: 3.4',
-    'Programming Language :: Python :: 3.5',
-    'Programming Language :: Python :: 3.6',
+    'Programming Language :: Python :: 3.10',
+    'Programming Language :: Python :: 3.11',
+    'Programming Language :: Python :: 3.12',
   ],
 )
\ No newline at end of file
@@ -0,0 +1,71 @@
+from pymorpho.adaptivecurveirm.adaptive_curve_irm import (
+    AdaptiveCurveIRM,
+    RateTableConfig,
+    StaticAdaptiveCurveIRM,
+)
+from pymorpho.adaptivecurveirm.libraries.adaptivecurve.constants_lib import ConstantsLib
+from pymorpho.adaptivecurveirm.libraries.adaptivecurve.exp_lib import ExpLib
+from pymorpho.utils.Mixer import World
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize(
+    "x", [-(10**30), -(10**18), 0, 10**18, ExpLib.WEXP_UPPER_BOUND, 10**30]
+)
+def test_w_exp_many_of_a_scalar(x):
+    exact = ExpLib.w_exp(x)
+    assert ExpLib.w_exp_many(x) == exact
+    assert ExpLib.w_exp_many(x, exact=False) == pytest.approx(exact, rel=1e-6)
+
+
+def test_borrow_rates_of_scalars():
+    arguments = (10**18, 5 * 10**17, 0, 10**9, 100)
+    exact = StaticAdaptiveCurveIRM.borrow_rates(*arguments, exact=True)
+    approximate = StaticAdaptiveCurveIRM.borrow_rates(*arguments, exact=False)
+    for value, expected in zip(approximate, exact):
+        assert np.shape(value) == ()
+        assert float(value) == pytest.approx(int(expected), rel=1e-6)
+
+
+def test_sweep_of_scalar_parameters():
+    utilizations = [9 * 10**17, 5 * 10**17, 0]
+    elapsed = [3600, 3600, 86400]
+    parameters = (
+        ConstantsLib.CURVE_STEEPNESS,
+        ConstantsLib.ADJUSTMENT_SPEED,
+        ConstantsLib.TARGET_UTILIZATION,
+        ConstantsLib.INITIAL_RATE_AT_TARGET,
+    )
+    exact = StaticAdaptiveCurveIRM.sweep(utilizations, elapsed, *parameters)
+    approximate = StaticAdaptiveCurveIRM.sweep(
+        utilizations, elapsed, *parameters, exact=False
+    )
+    batched = StaticAdaptiveCurveIRM.sweep(
+        utilizations, elapsed, *([parameter] * 2 for parameter in parameters)
+    )
+    for values, expected, rows in zip(approximate, exact, batched):
+        assert values.shape == expected.shape == (len(utilizations),)
+        assert list(rows[0]) == list(rows[1]) == list(expected)
+        assert values.astype(float) == pytest.approx(
+            expected.astype(float), rel=1e-6
+        )
+
+
+def test_approximate_rates_of_several_step_lengths():
+    world = World()
+    irm = AdaptiveCurveIRM(world.new_address(), world=world)
+    rate_at_target = ConstantsLib.INITIAL_RATE_AT_TARGET
+    arguments = (rate_at_target, 813_713_713_713_713_713, 10**18)
+    exact = {
+        elapsed: irm._borrow_rate_at(*arguments, elapsed) for elapsed in (12, 3600, 600)
+    }
+
+    world.approximate_rates = RateTableConfig(elapsed=(12, 3600), utilization_points=129)
+    for elapsed in (12, 3600):
+        approximate = irm._borrow_rate_at(*arguments, elapsed)
+        assert approximate != exact[elapsed]
+        assert approximate == pytest.approx(exact[elapsed], rel=1e-6)
+        assert irm.rate_table(world.approximate_rates, elapsed).elapsed == elapsed
+    with pytest.warns(UserWarning, match="computed exactly"):
+        assert irm._borrow_rate_at(*arguments, 600) == exact[600]
@@ -0,0 +1,37 @@
+import subprocess
+import sys
+
+
+# run in a fresh interpreter, where numpy hasn't been imported yet
+FIRST_ACCESS_FROM_THREADS = """
+import sys
+from threading import Barrier, Thread
+from pymorpho.adaptivecurveirm.libraries.adaptivecurve import exp_lib
+
+assert "numpy" not in sys.modules
+sys.setswitchinterval(1e-6)
+barrier = Barrier(16)
+errors = []
+
+def run():
+    barrier.wait()
+    try:
+        exp_lib.np.asarray([1, 2])
+    except BaseException as error:
+        errors.append(error)
+
+threads = [Thread(target=run) for _ in range(16)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+assert errors == [], errors
+
+import numpy
+assert type(numpy).__name__ == "module" and hasattr(numpy, "asarray")
+"""
+
+
+def test_first_access_from_threads_sees_the_whole_module():
+    for _ in range(3):
+        subprocess.run([sys.executable, "-c", FIRST_ACCESS_FROM_THREADS], check=True)
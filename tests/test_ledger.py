@@ -0,0 +1,108 @@
+from pymorpho.mocks.token import Token
+from pymorpho.utils.Mixer import World
+from threading import Thread
+import pytest
+
+
+def deploy_token(size: int):
+    world = World()
+    owner = world.new_address()
+    token = world.contracts_and_eoas[
+        Token("Token", "TKN", 18, sender=owner, world=world).deploy()
+    ]
+    wallets = world.new_addresses(size)
+    token.mint_many(wallets, [10**18] * size, owner)
+    return world, token, wallets
+
+
+def test_fork_only_pays_for_the_balances_it_writes():
+    world, token, wallets = deploy_token(1000)
+    forks = [world.fork() for _ in range(10)]
+    for fork in forks:
+        fork_token = fork.contracts_and_eoas[token.metadata.address]
+        fork_token.transfer(wallets[1], 10**17, wallets[0])
+        ledger = fork_token._balances
+        assert len(ledger._ids) == 0
+        assert len(ledger._balances) == 0
+        assert len(ledger._written) == 2
+    assert token.balance_of(wallets[0]) == 10**18
+    assert token.balance_of(wallets[1]) == 10**18
+
+
+def test_forks_do_not_see_the_accounts_of_their_siblings():
+    world, token, wallets = deploy_token(100)
+    untouched = world.fork()
+    minting = world.fork()
+    newcomers = minting.new_addresses(50)
+    minting.contracts_and_eoas[token.metadata.address].mint_many(
+        newcomers, [1] * 50
+    )
+
+    ledger = untouched.contracts_and_eoas[token.metadata.address]._balances
+    assert len(ledger._ids) == 0
+    assert all(parent._ids.get(newcomers[0]) is None for parent in ledger._parents)
+    assert ledger.get_many(newcomers) == [0] * 50
+    assert len(ledger) == 100
+
+
+def test_reverted_transaction_drops_the_accounts_it_interned():
+    world, token, wallets = deploy_token(10)
+    newcomer = world.new_address()
+    with pytest.raises(AssertionError):
+        with world.transaction():
+            token.mint(newcomer, 10**18)
+            token.transfer(newcomer, 2 * 10**18, wallets[0])
+    ledger = token._balances
+    assert newcomer not in ledger._ids
+    assert len(ledger._balances) == len(ledger._ids)
+    assert token.balance_of(newcomer) == 0
+    assert token.balance_of(wallets[0]) == 10**18
+
+
+def test_reverted_transaction_restores_the_balances_of_a_fork():
+    world, token, wallets = deploy_token(10)
+    fork = world.fork()
+    fork_token = fork.contracts_and_eoas[token.metadata.address]
+    fork_token.transfer(wallets[1], 1, wallets[0])
+    with pytest.raises(AssertionError):
+        with fork.transaction():
+            fork_token.transfer(wallets[2], 1, wallets[0])
+            fork_token.transfer(wallets[3], 1, wallets[4])
+            fork_token.transfer(wallets[4], 10**19, wallets[5])
+    assert fork_token.balance_of_many(wallets[:5]) == [
+        10**18 - 1,
+        10**18 + 1,
+        10**18,
+        10**18,
+        10**18,
+    ]
+    assert len(fork_token._balances._written) == 2
+
+
+def test_worlds_forked_from_each_other_run_in_separate_threads():
+    world, token, wallets = deploy_token(2000)
+    forks = [world.fork() for _ in range(8)]
+    errors = []
+
+    def run(fork: World, index: int):
+        try:
+            fork_token = fork.contracts_and_eoas[token.metadata.address]
+            newcomers = fork.new_addresses(5000)
+            fork_token.mint_many(newcomers, [index + 1] * 5000)
+            for wallet in wallets[:200]:
+                fork_token.transfer(newcomers[0], 1, wallet)
+            for _ in range(20):
+                fork.storage_size()
+            assert fork_token.balance_of(newcomers[0]) == index + 1 + 200
+            assert fork_token.balance_of_many(newcomers[1:3]) == [index + 1] * 2
+        except BaseException as error:
+            errors.append(error)
+
+    threads = [Thread(target=run, args=(fork, i)) for i, fork in enumerate(forks)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert token.balance_of(wallets[0]) == 10**18
+    assert len(token._balances) == 2000